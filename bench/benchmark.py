@@ -0,0 +1,183 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from collections import defaultdict
+
+import aiohttp
+
+from bench.mock_server import MockSite, add_arguments, serve_forever, site_options
+from config import config
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='端到端基准测试：启动本地模拟的研招网，用 main.py 的爬取流程完整爬取一遍，统计吞吐量和延迟')
+    parser.add_argument('--provinces', default='11,12', help='爬取的省份代码，逗号分隔，默认 11,12')
+    parser.add_argument('--sink', choices=['sqlite', 'mysql'], default='sqlite',
+                        help='数据写入位置：临时SQLite文件，或 config.yaml 中配置的MySQL（会写入该数据库），默认sqlite')
+    parser.add_argument('--sqlite-path', help='SQLite文件路径，默认在临时目录中新建')
+    parser.add_argument('--concurrent', action='store_true', help='使用并发模式（默认顺序模式）')
+    parser.add_argument('--workers', type=int, default=8, help='并发模式的worker数量，默认8')
+    parser.add_argument('--rate', type=float, default=1000, help='限速器的初始和最高速率（次/秒），默认1000')
+    parser.add_argument('--cooldown', type=float, default=1, help='"访问太频繁"后的暂停秒数，默认1')
+    parser.add_argument('--cache', action='store_true', help='启用响应缓存（默认关闭，每次都请求模拟服务器）')
+    parser.add_argument('--port', type=int, default=8765, help='模拟服务器端口，默认8765')
+    parser.add_argument('--output', help='把结果另存为JSON文件，便于对比不同版本')
+    add_arguments(parser)
+    return parser.parse_args()
+
+
+def configure(args, base_url, workdir):
+    """
+    覆盖配置：请求发往模拟服务器，缓存、失败日志写到临时目录。必须在导入 main 之前调用
+    """
+    config.set('crawler.base_url', base_url)
+    config.set('crawler.login_url', f'{base_url}/passport/login?entrytype=yzgr')
+    config.set('interval.seconds', 1 / args.rate)
+    config.set('rate_limit.max_rate', args.rate)
+    config.set('rate_limit.cooldown', args.cooldown)
+    config.set('cache.enabled', args.cache)
+    config.set('cache.path', os.path.join(workdir, 'responses.sqlite3'))
+    config.set('failure_journal.path', os.path.join(workdir, 'failed_requests.jsonl'))
+    config.set('concurrency.enabled', args.concurrent)
+    config.set('concurrency.workers', args.workers)
+    if args.sink == 'sqlite':
+        path = args.sqlite_path or os.path.join(workdir, 'bench.sqlite3')
+        if os.path.exists(path):
+            os.remove(path)
+        config.set('database.url', f'sqlite:///{path}')
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def summarize(latencies, elapsed, written, inserted, expected, server_stats):
+    requests = sum(len(values) for values in latencies.values())
+    all_latencies = [value for values in latencies.values() for value in values]
+    result = {
+        'elapsed': round(elapsed, 3),
+        'requests': requests,
+        'requests_per_second': round(requests / elapsed, 2) if elapsed else 0,
+        'rows_written': written,
+        'rows_inserted': inserted,
+        'rows_expected': expected,
+        'rows_per_second': round(written / elapsed, 2) if elapsed else 0,
+        'latency_p50_ms': round(percentile(all_latencies, 50) * 1000, 2),
+        'latency_p99_ms': round(percentile(all_latencies, 99) * 1000, 2),
+        'endpoints': {
+            endpoint: {
+                'requests': len(values),
+                'p50_ms': round(percentile(values, 50) * 1000, 2),
+                'p99_ms': round(percentile(values, 99) * 1000, 2),
+            } for endpoint, values in sorted(latencies.items())
+        },
+        'server': server_stats,
+    }
+    return result
+
+
+def print_result(result):
+    print("\n========== 基准测试结果 ==========")
+    print(f"用时：{result['elapsed']}秒")
+    print(f"请求：{result['requests']}次，{result['requests_per_second']}次/秒，"
+          f"延迟 p50 {result['latency_p50_ms']}ms，p99 {result['latency_p99_ms']}ms")
+    print(f"数据：写入{result['rows_written']}行（新增{result['rows_inserted']}行，应有{result['rows_expected']}行），"
+          f"{result['rows_per_second']}行/秒")
+    for endpoint, stats in result['endpoints'].items():
+        print(f"  {endpoint}：{stats['requests']}次，p50 {stats['p50_ms']}ms，p99 {stats['p99_ms']}ms")
+    breakdown = result.get('time_breakdown')
+    if breakdown:
+        print(f"累计耗时：限速等待{breakdown['rate_limiter_wait']}秒，网络请求{breakdown['network']}秒，"
+              f"数据库写入{breakdown['db_write']}秒，写入队列已满等待{breakdown['db_backpressure']}秒")
+    injected = {key: value for key, value in result['server'].items()
+                if key.endswith(('_throttle', '_login', '_error'))}
+    if injected:
+        print(f"模拟服务器注入的异常：{injected}")
+
+
+async def bench(args, base_url):
+    # 配置覆盖之后才能导入爬虫和数据库模块
+    import main
+    from crawler.crawler import Crawler
+    from crawler.cache import ResponseCache
+    from crawler.logs import setup_logging, stop_logging
+    from crawler.metrics import metrics
+    from data import db, entity
+
+    setup_logging()
+    if args.sink == 'sqlite':
+        entity.Base.metadata.create_all(db.engine)
+
+    # 记录每个接口请求的耗时（从 Crawler._post 调用到返回，包括并发限制和限速器的等待）
+    latencies = defaultdict(list)
+    post = Crawler._post
+
+    async def timed_post(self, url, data):
+        started = time.perf_counter()
+        try:
+            return await post(self, url, data)
+        finally:
+            latencies[ResponseCache.endpoint(url)].append(time.perf_counter() - started)
+
+    Crawler._post = timed_post
+    run_args = argparse.Namespace(
+        login='password', username='bench', password='bench', cookie=None, network='direct', breakpoint='none',
+        reset_checkpoint=False, refresh_cache=False, delta=False, bp_province=None, bp_school=None, bp_major=None,
+        provinces=args.provinces, shards=None,
+    )
+    started = time.perf_counter()
+    try:
+        await main.work(run_args)
+    except SystemExit:
+        print("爬取流程提前退出")
+        db.close()
+    finally:
+        Crawler._post = post
+    elapsed = time.perf_counter() - started
+    stop_logging()
+
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f'{base_url}/stats') as response:
+            server_stats = await response.json()
+    provinces = len([code for code in args.provinces.split(',') if code.strip()])
+    expected = MockSite.from_options(site_options(args)).expected_rows(provinces)
+    result = summarize(latencies, elapsed, db.writer.written, db.writer.inserted, expected, server_stats)
+    result['time_breakdown'] = metrics.time_breakdown()
+    return result
+
+
+def run(args):
+    base_url = f'http://127.0.0.1:{args.port}'
+    # 模拟服务器在单独的进程中运行，不和爬虫争抢事件循环
+    ctx = multiprocessing.get_context('spawn')
+    ready = ctx.Event()
+    server = ctx.Process(target=serve_forever, args=(site_options(args), '127.0.0.1', args.port, ready),
+                         name='mock-server', daemon=True)
+    server.start()
+    try:
+        if not ready.wait(30):
+            raise RuntimeError('模拟服务器启动超时')
+        with tempfile.TemporaryDirectory(prefix='yzw-bench-') as workdir:
+            configure(args, base_url, workdir)
+            result = asyncio.run(bench(args, base_url))
+    finally:
+        server.terminate()
+        server.join()
+    print_result(result)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到{args.output}")
+    return result
+
+
+if __name__ == '__main__':
+    run(parse_args())
@@ -0,0 +1,228 @@
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+
+from aiohttp import web
+
+PAGE_SIZE = 10  # 学校列表、专业列表每页条数（与研招网一致）
+PROVINCE_NAMES = {'11': '北京', '12': '天津', '13': '河北', '14': '山西', '21': '辽宁', '22': '吉林', '23': '黑龙江',
+                  '31': '上海', '32': '江苏', '33': '浙江', '34': '安徽', '35': '福建', '36': '江西', '37': '山东',
+                  '41': '河南', '42': '湖北', '43': '湖南', '44': '广东', '50': '重庆', '51': '四川', '61': '陕西',
+                  '15': '内蒙', '45': '广西', '46': '海南', '52': '贵州', '53': '云南', '54': '西藏', '62': '甘肃',
+                  '63': '青海', '64': '宁夏', '65': '新疆'}
+LOGIN_PAGE = '''<html><body><form id="fm1" method="post">
+<input type="text" name="username"><input type="password" name="password">
+<input type="hidden" name="lt" value="{lt}"><input type="hidden" name="execution" value="{execution}">
+<input type="hidden" name="_eventId" value="submit"></form></body></html>'''
+
+
+class MockSite:
+    """
+    本地模拟的研招网：dws.do、dwzys.do、yjfxs.do 返回与研招网相同结构的JSON，数据按参数确定性生成，
+    并可以注入延迟、"访问太频繁"、"请登录"和HTTP 500错误，用于离线测量爬虫性能。
+    每个学校 majors 个专业，每个专业 directions 个研究方向，每个研究方向 subject_groups 个考试科目组合
+    """
+
+    def __init__(self, schools=20, majors=15, directions=3, subject_groups=2, latency=0.0, jitter=0.0,
+                 throttle_rate=0.0, login_rate=0.0, error_rate=0.0, seed=0):
+        self.schools = schools
+        self.majors = majors
+        self.directions = directions
+        self.subject_groups = subject_groups
+        self.latency = latency  # 每个请求的平均延迟，单位：秒
+        self.jitter = jitter  # 延迟在 ±jitter 秒内随机浮动
+        self.throttle_rate = throttle_rate  # 返回"访问太频繁"的概率
+        self.login_rate = login_rate  # 返回"请登录"的概率
+        self.error_rate = error_rate  # 返回HTTP 500的概率
+        self.random = random.Random(seed)
+        self.stats = Counter()  # 各接口的请求数和注入的异常数
+        self.started = time.monotonic()
+
+    @classmethod
+    def from_options(cls, options):
+        return cls(**{key: value for key, value in options.items() if value is not None})
+
+    def expected_rows(self, provinces):
+        """
+        爬取 provinces 个省份后 major 表应有的行数
+        """
+        return provinces * self.schools * self.majors * self.directions * self.subject_groups
+
+    def app(self):
+        app = web.Application(middlewares=[self.inject])
+        app.router.add_post('/zsml/rs/dws.do', self.dws)
+        app.router.add_post('/zsml/rs/dwzys.do', self.dwzys)
+        app.router.add_post('/zsml/rs/yjfxs.do', self.yjfxs)
+        app.router.add_get('/zsml/a/dw.do', self.dw)
+        app.router.add_get('/passport/login', self.login_page)
+        app.router.add_post('/passport/login', self.login)
+        app.router.add_get('/stats', self.stats_handler)
+        return app
+
+    @web.middleware
+    async def inject(self, request, handler):
+        """
+        先按配置等待一段时间，再按概率返回错误、"访问太频繁"或"请登录"，否则返回正常数据
+        """
+        if request.path == '/stats':
+            return await handler(request)
+        endpoint = request.path.rsplit('/', 1)[-1].split('.', 1)[0]
+        self.stats[f'{endpoint}_requests'] += 1
+        delay = self.latency + self.random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if not request.path.startswith('/zsml/rs/'):
+            return await handler(request)
+        roll = self.random.random()
+        if roll < self.error_rate:
+            self.stats[f'{endpoint}_error'] += 1
+            return web.Response(status=500, text='Internal Server Error')
+        roll -= self.error_rate
+        if roll < self.throttle_rate:
+            self.stats[f'{endpoint}_throttle'] += 1
+            return web.json_response({'flag': False, 'msg': '访问太频繁'})
+        roll -= self.throttle_rate
+        if roll < self.login_rate:
+            self.stats[f'{endpoint}_login'] += 1
+            return web.json_response({'flag': False, 'msg': '请登录'})
+        return await handler(request)
+
+    @staticmethod
+    def page(items, start, page_size):
+        return {
+            'list': items[start:start + page_size],
+            'nextPageAvailable': start + page_size < len(items),
+            'totalCount': len(items),
+            'totalPage': (len(items) + page_size - 1) // page_size,
+        }
+
+    def school(self, province_code, i):
+        return {'dwdm': f'{province_code}{i:03d}', 'dwmc': f'模拟大学{province_code}-{i:03d}', 'szss': province_code,
+                'zgy': '0', 'yjsy': '1', 'zzhxk': '0'}
+
+    def major(self, school, j):
+        return {'dwdm': school['dwdm'], 'dwmc': school['dwmc'], 'zydm': f'{80100 + j:06d}', 'zymc': f'模拟专业{j}',
+                'xwlxmc': '学术学位' if j % 2 else '专业学位', 'yjxkdm': f'{801 + j // 10:04d}'}
+
+    def direction(self, form, j, d):
+        school_code, major_code = form.get('dwdm', ''), form.get('zydm', '')
+        province_code = school_code[:2]
+        return {
+            'dwmc': f'模拟大学{province_code}-{school_code[2:]}',
+            'dwdm': school_code,
+            'szss': PROVINCE_NAMES.get(province_code, province_code),
+            'zydm': major_code,
+            'zymc': form.get('zymc'),
+            'ksfsmc': '统考',
+            'yxsmc': f'({j % 5 + 1:03d})第{j % 5 + 1}学院',
+            'xxfs': '1' if d % 3 else '2',
+            'yjfxmc': f'({d + 1:02d})研究方向{d + 1}',
+            'tydxs': '0',
+            'jsggjh': '0',
+            'zdjs': '',
+            'nzsrsstr': str(5 + d),
+            'kskmz': [{
+                'km1Vo': {'kskmmc': '(101)思想政治理论'},
+                'km2Vo': {'kskmmc': '(201)英语一'},
+                'km3Vo': {'kskmmc': f'(30{g + 1})数学（{g + 1}）'},
+                'km4Vo': {'kskmmc': f'(8{j % 100:02d})专业课{g + 1}'},
+            } for g in range(self.subject_groups)],
+        }
+
+    async def dws(self, request):
+        form = await request.post()
+        province_code = form.get('ssdm', '')
+        schools = [self.school(province_code, i) for i in range(1, self.schools + 1)]
+        return web.json_response({'flag': True, 'msg': self.page(schools, int(form.get('start', 0)), PAGE_SIZE)})
+
+    async def dwzys(self, request):
+        form = await request.post()
+        school = {'dwdm': form.get('dwdm', ''), 'dwmc': form.get('dwmc', '')}
+        majors = [self.major(school, j) for j in range(self.majors)]
+        return web.json_response({'flag': True, 'msg': self.page(majors, int(form.get('start', 0)), PAGE_SIZE)})
+
+    async def yjfxs(self, request):
+        form = await request.post()
+        j = int(form.get('zydm', '0') or 0) - 80100
+        directions = [self.direction(form, j, d) for d in range(self.directions)]
+        page_size = int(form.get('pageSize', PAGE_SIZE) or PAGE_SIZE)
+        return web.json_response({'flag': True, 'msg': self.page(directions, int(form.get('start', 0)), page_size)})
+
+    async def dw(self, request):
+        return web.Response(text='<html><body>硕士专业目录</body></html>', content_type='text/html')
+
+    async def login_page(self, request):
+        return web.Response(text=LOGIN_PAGE.format(lt='LT-mock', execution='e1s1'), content_type='text/html')
+
+    async def login(self, request):
+        form = await request.post()
+        if form.get('lt') != 'LT-mock' or form.get('execution') != 'e1s1':
+            return web.Response(status=401, text='登录失败')
+        response = web.HTTPFound('/zsml/a/dw.do')
+        response.set_cookie('JSESSIONID', 'mock-session')
+        return response
+
+    async def stats_handler(self, request):
+        stats = dict(self.stats)
+        stats['uptime'] = round(time.monotonic() - self.started, 3)
+        return web.json_response(stats)
+
+
+def add_arguments(parser):
+    """
+    模拟服务器的参数，benchmark.py 共用
+    """
+    parser.add_argument('--schools', type=int, default=20, help='每个省份的学校数，默认20')
+    parser.add_argument('--majors', type=int, default=15, help='每个学校的专业数，默认15')
+    parser.add_argument('--directions', type=int, default=3, help='每个专业的研究方向数，默认3')
+    parser.add_argument('--subject-groups', type=int, default=2, help='每个研究方向的考试科目组合数，默认2')
+    parser.add_argument('--latency', type=float, default=0.0, help='每个请求的平均延迟（秒），默认0')
+    parser.add_argument('--jitter', type=float, default=0.0, help='延迟的随机浮动范围（秒），默认0')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='返回"访问太频繁"的概率，默认0')
+    parser.add_argument('--login-rate', type=float, default=0.0,
+                        help='返回"请登录"的概率，默认0（爬虫累计遇到10次"请登录"会自动终止）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回HTTP 500的概率，默认0')
+    parser.add_argument('--seed', type=int, default=0, help='随机数种子，相同参数下注入的异常完全一致')
+
+
+def site_options(args):
+    return {
+        'schools': args.schools, 'majors': args.majors, 'directions': args.directions,
+        'subject_groups': args.subject_groups, 'latency': args.latency, 'jitter': args.jitter,
+        'throttle_rate': args.throttle_rate, 'login_rate': args.login_rate, 'error_rate': args.error_rate,
+        'seed': args.seed,
+    }
+
+
+async def serve(options, host='127.0.0.1', port=8765, ready=None):
+    """
+    启动模拟服务器并一直运行，ready 为 multiprocessing.Event 时启动完成后通知父进程
+    """
+    runner = web.AppRunner(MockSite.from_options(options).app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    if ready is not None:
+        ready.set()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+def serve_forever(options, host='127.0.0.1', port=8765, ready=None):
+    try:
+        asyncio.run(serve(options, host, port, ready))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='本地模拟的研招网接口，用于离线测试和基准测试')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    add_arguments(parser)
+    args = parser.parse_args()
+    print(f"模拟服务器已启动：http://{args.host}:{args.port}（/stats 查看请求统计）")
+    serve_forever(site_options(args), args.host, args.port)
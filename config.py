@@ -20,6 +20,16 @@ class Config:
                 return default
         return data
 
+    # 修改配置项（只在内存中生效），需要在读取该配置的模块导入之前调用，供基准测试等工具覆盖配置
+    def set(self, key_path, value, sep="."):
+        keys = key_path.split(sep)
+        data = self._config
+        for key in keys[:-1]:
+            if not isinstance(data.get(key), dict):
+                data[key] = {}
+            data = data[key]
+        data[keys[-1]] = value
+
 
 # 实例化配置对象
 config = Config()
@@ -0,0 +1,97 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+
+from config import config
+
+logger = logging.getLogger('yzw.cache')
+
+
+class ResponseCache:
+    """
+    列表接口的本地响应缓存（SQLite文件），以 (接口, 表单) 为key，超过 ttl 秒的缓存视为过期。
+    学校列表、专业列表一个招生季只变化几次，重复爬取时可以直接使用缓存，只重新请求专业详情
+    """
+
+    def __init__(self, path, ttl=86400, endpoints=('dws', 'dwzys'), enabled=True):
+        self.path = path
+        self.ttl = ttl
+        self.endpoints = set(endpoints)
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+
+    @classmethod
+    def from_config(cls):
+        return cls(
+            path=config.get('cache.path', 'cache/responses.sqlite3'),
+            ttl=config.get('cache.ttl', 86400),
+            endpoints=config.get('cache.endpoints', ['dws', 'dwzys']) or [],
+            enabled=config.get('cache.enabled', True),
+        )
+
+    @staticmethod
+    def endpoint(url):
+        # https://yz.chsi.com.cn/zsml/rs/dws.do -> dws
+        return url.rsplit('/', 1)[-1].split('.', 1)[0]
+
+    def accepts(self, url):
+        return self.enabled and self.endpoint(url) in self.endpoints
+
+    @staticmethod
+    def make_key(url, form_data):
+        form = json.dumps({k: str(v) for k, v in form_data.items()}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(f"{ResponseCache.endpoint(url)}\n{form}".encode('utf-8')).hexdigest()
+
+    def connect(self):
+        if self._conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            # 多进程模式下每个进程各自打开连接，写入冲突时等待而不是报错
+            self._conn = sqlite3.connect(self.path, timeout=30)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS response (key TEXT PRIMARY KEY, endpoint TEXT, body TEXT, created REAL)')
+        return self._conn
+
+    def get(self, url, form_data):
+        """
+        返回未过期的缓存数据，没有时返回None
+        """
+        try:
+            row = self.connect().execute('SELECT body, created FROM response WHERE key = ?',
+                                         (self.make_key(url, form_data),)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"读取响应缓存失败：{e}")
+            return None
+        if row is None or time.time() - row[1] > self.ttl:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, url, form_data, data):
+        try:
+            with self.connect() as conn:
+                conn.execute('INSERT OR REPLACE INTO response (key, endpoint, body, created) VALUES (?, ?, ?, ?)',
+                             (self.make_key(url, form_data), self.endpoint(url),
+                              json.dumps(data, ensure_ascii=False), time.time()))
+        except sqlite3.Error as e:
+            logger.warning(f"写入响应缓存失败：{e}")
+
+    def clear(self):
+        with self.connect() as conn:
+            conn.execute('DELETE FROM response')
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+# 全局共享的响应缓存
+response_cache = ResponseCache.from_config()
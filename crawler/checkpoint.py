@@ -0,0 +1,97 @@
+import logging
+from collections import Counter
+
+from data import db
+
+logger = logging.getLogger('yzw.checkpoint')
+
+
+class Checkpoint:
+    """
+    抓取进度：以 省份 -> 学校 -> 专业 为单元记录完成情况
+    一个单元在自身所有分页和全部下级单元都结束后才算结束，期间没有失败则记为done，否则记为failed，
+    状态经数据库写入线程持久化到 crawl_state 表，续爬时跳过已完成的单元
+    """
+
+    def __init__(self, done=None, persist=True):
+        self.done = done if done is not None else set()  # 已完成的单元 {(unit_type, unit_key)}
+        self.persist = persist
+        self.pending = {}  # 进行中的单元 -> 未结束的分页/下级单元数量
+        self.parents = {}  # 单元 -> 上级单元
+        self.failed = set()  # 进行中且已出现失败的单元
+        self.callbacks = {}  # 单元 -> 成功结束后执行的协程函数
+        self.schools_done = Counter()  # 省份代码 -> 本次成功完成的学校数，用于输出进度
+
+    @classmethod
+    def load(cls):
+        """
+        从数据库读取已完成的单元
+        """
+        done = db.load_done_units()
+        logger.info(f"读取抓取状态：已完成{len(done)}个单元")
+        return cls(done)
+
+    def is_done(self, unit):
+        return unit in self.done
+
+    def open(self, unit, parent=None):
+        """
+        登记一个新单元（计入上级单元的未结束数量），单元已在进行中时视为多一页
+        """
+        if unit in self.pending:
+            self.pending[unit] += 1
+            return
+        self.pending[unit] = 1
+        if parent in self.pending:
+            self.parents[unit] = parent
+            self.pending[parent] += 1
+
+    def when_done(self, unit, callback):
+        """
+        单元成功结束（没有失败）时执行 await callback()
+        """
+        if unit in self.pending:
+            self.callbacks[unit] = callback
+
+    def fail(self, unit):
+        if unit in self.pending:
+            self.failed.add(unit)
+
+    async def close(self, unit):
+        """
+        单元的一页（或一个下级单元）结束，全部结束时记录状态并通知上级单元
+        """
+        if unit not in self.pending:
+            return
+        self.pending[unit] -= 1
+        if self.pending[unit] > 0:
+            return
+        del self.pending[unit]
+        failed = unit in self.failed
+        self.failed.discard(unit)
+        callback = self.callbacks.pop(unit, None)
+        if not failed:
+            self.done.add(unit)
+            if callback:
+                await callback()
+        if self.persist:
+            await db.save_state_async(unit[0], unit[1], 'failed' if failed else 'done')
+        parent = self.parents.pop(unit, None)
+        if unit[0] == 'school' and not failed and parent is not None:
+            self.schools_done[parent[1]] += 1
+        if parent is not None:
+            if failed:
+                self.fail(parent)
+            await self.close(parent)
+
+
+def province_unit(province_code):
+    return 'province', str(province_code)
+
+
+def school_unit(obj):
+    return 'school', str(obj.get('dwdm'))
+
+
+def major_unit(item):
+    return 'major', f"{item.get('dwdm')}:{item.get('zydm')}:{item.get('zymc')}"
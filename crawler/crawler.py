@@ -1,43 +1,54 @@
 import asyncio
-import random
 from time import sleep
 from urllib.parse import urlencode
 import datetime
-import re
-import ast
+import time
 import aiohttp
 import logging
 import sys
+from itertools import count
 
 from config import config
 from data import db
 from proxy_manager import ProxyManager
+from crawler.rate_limiter import rate_limiter
+from crawler.checkpoint import Checkpoint, province_unit, school_unit, major_unit
+from crawler.journal import journal, province_request, school_request, major_request
+from crawler.cache import ResponseCache, response_cache
+from crawler.delta import MajorList
+from crawler.metrics import metrics
+from crawler.trace import tracer
 
+logger = logging.getLogger('yzw.crawler')
 
-def log_failed_request(request_type, info, item=None, province_code=None):
-    timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    # 如果有item，补全xwlxmc等字段
-    if item is not None:
-        # 只补全常用字段，避免None
-        xwlxmc = item.get('xwlxmc', '')
-        info += f", xwlxmc: {xwlxmc}"
-    # 如果有province_code，补充到info
-    if province_code is not None:
-        info += f", province_code: {province_code}"
-    log_line = f"[{timestamp}] [{request_type}] {info}，错误原因: 重试次数过多\n"
-    with open('failed_requests.log', 'a', encoding='utf-8') as f:
-        f.write(log_line)
+# 研招网地址，基准测试时指向本地的模拟服务器
+BASE_URL = config.get('crawler.base_url', 'https://yz.chsi.com.cn').rstrip('/')
+DW_URL = f'{BASE_URL}/zsml/a/dw.do'  # 同步登录状态
+DWS_URL = f'{BASE_URL}/zsml/rs/dws.do'  # 省份 -> 学校列表
+DWZYS_URL = f'{BASE_URL}/zsml/rs/dwzys.do'  # 学校 -> 专业列表
+YJFXS_URL = f'{BASE_URL}/zsml/rs/yjfxs.do'  # 专业 -> 研究方向详情
+# 研究方向详情每页条数，一次请求尽量拿到一个专业的全部研究方向
+DETAIL_PAGE_SIZE = config.get('crawler.detail_page_size', 50)
 
 
-async def do_sleep():
-    interval = config.get('interval.seconds')  # 抓取时间间隔，单位为秒
-    await asyncio.sleep(interval * random.uniform(0.8, 1.2))  # 随机延时，防止被封禁
+class RequestInfo:
+    """
+    请求放弃时写入失败日志的内容：name 失败类型（如 fetch_school_info），unit 所属单元，request 重新执行所需的参数，
+    describe 日志中的描述（如 "省份代码: 11, 当前页: 2"），scope 放弃的范围（如 "当前省份"）
+    """
+
+    def __init__(self, name, unit, request, describe, scope):
+        self.name = name
+        self.unit = unit
+        self.request = request
+        self.describe = describe
+        self.scope = scope
 
 
 class Crawler:
-    def __init__(self, session, breakpoint=None, proxy_manager=None):
+    def __init__(self, session, breakpoint=None, proxy_manager=None, checkpoint=None, delta=None):
         self.session = session
-        self.url = 'https://yz.chsi.com.cn/zsml/rs/dws.do'
+        self.url = DWS_URL
         self.form_data = {
             'dwmc': '',
             'dwdm': '',
@@ -55,150 +66,361 @@ class Crawler:
         self.reached_major = False if self.breakpoint.get('major_code') else True
         self.login_prompt_count = 0  # 统计"请登录"出现次数
         self.proxy_manager = proxy_manager  # 代理管理器
+        # 每个接口单独的并发上限（顺序模式下同一时间本来就只有一个请求）
+        limits = config.get('concurrency.limits', {}) or {}
+        self.limits = {
+            DWS_URL: asyncio.Semaphore(limits.get('dws', 1)),
+            DWZYS_URL: asyncio.Semaphore(limits.get('dwzys', 2)),
+            YJFXS_URL: asyncio.Semaphore(limits.get('yjfxs', 4)),
+        }
+        self.queue = None  # 并发模式下的任务队列，由run()创建
+        self.province_names = {}  # 并发模式下 省份代码 -> 省份名称，用于断点判断
+        self.checkpoint = checkpoint or Checkpoint(persist=False)  # 抓取进度，未启用时只在内存中统计
+        self.delta = delta  # 增量模式的 DeltaTracker，None表示全量爬取
 
     async def handle_login_prompt(self):
         self.login_prompt_count += 1
         if self.login_prompt_count >= 10:
-            print("检测到'请登录'超过10次，程序自动终止！")
+            logger.error("检测到'请登录'超过10次，程序自动终止！")
             raise SystemExit
-        await do_sleep()
-        await self.session.get('https://yz.chsi.com.cn/zsml/a/dw.do')
-        await do_sleep()
+        await rate_limiter.acquire()
+        proxy = self.proxy_manager.get_proxy() if self.proxy_manager else None
+        await self.session.get(DW_URL, proxy=proxy)
 
-    # 爬取指定省份地区的学校信息
-    async def fetch_school_info(self, province_code, curPage=1, go_on=True, retry=0, target_school_code=None):
-        if retry > 5:
-            print("重试次数过多，放弃当前省份学校抓取")
-            info = f"省份代码: {province_code}, 当前页: {curPage}, 断点: {self.breakpoint}"
-            log_failed_request('fetch_school_info', info, province_code=province_code)
+    async def _post(self, url, data):
+        """
+        发送POST请求，返回 (状态码, json数据)，同一接口的并发数受 self.limits 限制，
+        发送节奏由全局限速器控制，每个请求从代理池轮流取一个代理，并把响应结果反馈给限速器和代理池。
+        学校列表、专业列表优先使用本地缓存，命中缓存时不发送请求
+        """
+        endpoint = ResponseCache.endpoint(url)
+        cacheable = response_cache.accepts(url)
+        # 增量模式要用最新的专业列表计算指纹，专业列表只更新缓存，不读取缓存
+        if cacheable and not (self.delta and endpoint == 'dwzys'):
+            cached = response_cache.get(url, data)
+            if cached is not None:
+                metrics.inc('yzw_requests_total', endpoint=endpoint, outcome='cache_hit')
+                return 200, cached
+        async with self.limits[url]:
+            await rate_limiter.acquire()
+            proxy = self.proxy_manager.get_proxy() if self.proxy_manager else None
+            trace = tracer.request_context(endpoint, proxy)
+            started = time.monotonic()
+            try:
+                async with self.session.post(url, data=data, proxy=proxy, trace_request_ctx=trace) as response:
+                    if response.status != 200:
+                        tracer.finish(trace)
+                        rate_limiter.on_error()
+                        metrics.observe('yzw_request_seconds', time.monotonic() - started, endpoint=endpoint)
+                        metrics.inc('yzw_requests_total', endpoint=endpoint, outcome=f'http_{response.status}')
+                        return response.status, None
+                    result = await response.json()
+                    tracer.finish(trace)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                tracer.finish(trace, e)
+                rate_limiter.on_error()
+                metrics.observe('yzw_request_seconds', time.monotonic() - started, endpoint=endpoint)
+                metrics.inc('yzw_requests_total', endpoint=endpoint, outcome='error')
+                if self.proxy_manager:
+                    self.proxy_manager.report_failure(proxy)
+                raise
+        elapsed = time.monotonic() - started
+        metrics.observe('yzw_request_seconds', elapsed, endpoint=endpoint)
+        if self.proxy_manager:
+            self.proxy_manager.report_success(proxy, elapsed)
+        msg = result.get('msg')
+        if msg == '访问太频繁':
+            rate_limiter.on_throttle()
+        else:
+            rate_limiter.on_success()
+        metrics.inc('yzw_requests_total', endpoint=endpoint,
+                    outcome='throttle' if msg == '访问太频繁' else 'login' if msg == '请登录' else 'ok')
+        # 只缓存正常的列表数据，"请登录"、"访问太频繁"等提示不缓存
+        if cacheable and result.get('flag') and isinstance(result.get('msg'), dict):
+            response_cache.set(url, data, result)
+        return 200, result
+
+    def open_province(self, province_code):
+        """
+        登记一个省份单元，已完成的省份返回False
+        """
+        unit = province_unit(province_code)
+        if self.checkpoint.is_done(unit):
+            return False
+        self.checkpoint.open(unit)
+        return True
+
+    def _log_failure(self, unit, request_type, info, request):
+        # 记录失败请求的完整参数，并把所属单元标记为失败，续爬时会重新抓取
+        self.checkpoint.fail(unit)
+        journal.record(request_type, info, request)
+        metrics.inc('yzw_failures_total', type=request_type)
+
+    async def replay(self, request):
+        """
+        重新执行失败日志中记录的请求，分页请求会继续抓取后面的页
+        """
+        kind = request['kind']
+        if kind == 'province':
+            await self.fetch_school_info(request['province_code'], request['curPage'])
+        elif kind == 'school':
+            await self.fetch_school_major(request['obj'], request['curPage'])
+        else:
+            await self.fetch_major(request['item'], request['form'])
+
+    def _at_breakpoint_province(self, province_code):
+        # 并发模式下多个省份同时爬取，学校断点只作用于断点所在省份
+        name = self.province_names.get(province_code)
+        return name is None or name == self.breakpoint.get('province')
+
+    def _at_breakpoint_school(self, obj):
+        # 专业断点只作用于断点所在学校（未指定学校时保持原有逻辑）
+        school_name = self.breakpoint.get('school_name')
+        return not school_name or obj.get('dwmc') == school_name
+
+    async def _dispatch(self, kind, *args):
+        """
+        顺序模式下直接执行下一级抓取，并发模式下放入任务队列交给worker
+        """
+        if self.queue is not None:
+            self.queue.put_nowait((kind, *args))
             return
-        self.form_data['ssdm'] = province_code
-        self.form_data['curPage'] = curPage
-        self.form_data['start'] = str((curPage - 1) * 10)
+        if kind == 'school':
+            await self.fetch_school_major(*args)
+        else:
+            await self.fetch_major(*args)
 
+    async def run(self, provinces, workers=None):
+        """
+        并发模式：以 (省份, 学校, 专业) 为工作单元组成任务队列，由 workers 个协程并发消费
+        provinces: [{'code': '11', 'name': '北京'}, ...]
+        """
+        workers = workers or config.get('concurrency.workers', 8)
+        self.queue = asyncio.Queue()
+        for province in provinces:
+            self.province_names[province['code']] = province['name']
+            if not self.open_province(province['code']):
+                logger.info(f"{province['name']}已全部完成，跳过")
+                continue
+            self.queue.put_nowait(('province', province['code']))
+
+        tasks = [asyncio.create_task(self._worker()) for _ in range(workers)]
         try:
-            async with self.session.post(self.url, data=self.form_data) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if not data.get('flag'):
-                        msg = data.get('msg')
-                        if msg == '请登录':
-                            await self.handle_login_prompt()
-                        elif msg == '访问太频繁':
-                            wait_time = retry * 2
-                            print(f"访问太频繁，等待{wait_time}秒后重试……")
-                            await asyncio.sleep(wait_time)
-                            print("正在重试……")
-                            await do_sleep()
-                            await self.fetch_school_info(province_code, curPage, False, retry + 1)
-                            return
-                        print(msg)
-                        print("警告：msg字段不是dict或缺少list，内容如下：", data)
-                        log_failed_request('fetch_school_info_msg_type', str(data), province_code=province_code)
-                        return
-                    else:
-                        msg = data.get('msg')
-                        if msg == '请登录':
-                            await self.handle_login_prompt()
-                            return
-                        elif msg == '访问太频繁':
-                            wait_time = retry * 2
-                            print(f"访问太频繁，等待{wait_time}秒后重试……")
-                            await asyncio.sleep(wait_time)
-                            print("正在重试……")
-                            await do_sleep()
-                            await self.fetch_school_info(province_code, curPage, False, retry + 1)
-                            return
-                        if isinstance(msg, dict) and 'list' in msg:
-                            list_ = msg['list']
-                            for item in list_:
-                                school_name = item.get('dwmc')
-                                school_code = item.get('dwdm')
-                                # 日志重试/单校重试时，优先过滤
-                                if target_school_code and str(school_code) != str(target_school_code):
-                                    continue
-                                # 正常断点续爬时，使用断点跳过逻辑
-                                if not target_school_code:
-                                    if not self.reached_school:
-                                        if school_name == self.breakpoint.get('school_name'):
-                                            pass  # 只在断点学校用专业断点
-                                        else:
-                                            continue
-                                item['ssdm'] = province_code  # 补充省份代码
-                                await self.fetch_school_major(item)
-                        else:
-                            print("警告：msg字段不是dict或缺少list，内容如下：", data)
-                            log_failed_request('fetch_school_info_msg_type', str(data), province_code=province_code)
-                            return
-
-                    # 只在不指定目标学校时才递归分页
-                    if not target_school_code and data.get('msg') and isinstance(data.get('msg'), dict) and data.get('msg').get('nextPageAvailable') and go_on:
-                        await do_sleep()
-                        await self.fetch_school_info(province_code, curPage + 1)
+            await self.queue.join()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.queue = None
+
+    async def _worker(self):
+        while True:
+            kind, *args = await self.queue.get()
+            try:
+                if kind == 'province':
+                    await self.fetch_school_info(*args)
+                elif kind == 'school':
+                    await self.fetch_school_major(*args)
                 else:
-                    print(f"请求失败，状态码: {response.status}")
-                    await self.fetch_school_info(province_code, curPage, False, retry + 1)
+                    await self.fetch_major(*args)
+            except Exception as e:
+                logger.error(f"工作单元执行异常（{kind}）：{e}")
+            finally:
+                self.queue.task_done()
+
+    async def _request(self, url, form_data, info):
+        """
+        请求执行器：重复发送请求直到拿到列表数据（包含list的msg），返回msg。
+        非200状态码和"访问太频繁"直接重试（限速器已经降速），网络连接错误换一个代理重试，其他异常等待3秒后重试；
+        "请登录"时同步登录状态，放弃时写入失败日志并返回None
+        """
+        endpoint = ResponseCache.endpoint(url)
+        for retry in count():
+            if retry > 5:
+                logger.error(f"重试次数过多，放弃{info.scope}")
+                self._log_failure(info.unit, info.name, f"{info.describe}, 断点: {self.breakpoint}", info.request)
+                return None
+            if retry:
+                metrics.inc('yzw_retries_total', endpoint=endpoint)
+            try:
+                status, data = await self._post(url, form_data)
+            except aiohttp.ClientConnectorError as e:
+                delay = await self._connection_failed(e, retry, info)
+                if delay is None:
                     return None
-        except aiohttp.ClientConnectorError as e:
-            print(f"网络连接错误：{e}")
-            if self.proxy_manager and self.proxy_manager.should_use_proxy():
-                print("尝试切换代理...")
-                new_proxy = await self.proxy_manager.switch_proxy()
-                if new_proxy:
-                    print(f"已切换到新代理: {new_proxy}")
-                    if retry < 3:
-                        print(f"等待5秒后重试...")
-                        await asyncio.sleep(5)
-                        await self.fetch_school_info(province_code, curPage, False, retry + 1)
-                    else:
-                        print("网络连接失败，跳过当前省份")
-                        log_failed_request('fetch_school_info_network_error', f"省份代码: {province_code}, 当前页: {curPage}", province_code=province_code)
-                else:
-                    # 所有代理都失败，使用自身IP
-                    print("所有代理都失败，尝试使用自身IP...")
-                    if retry < 2:  # 给自身IP一次重试机会
-                        await asyncio.sleep(3)
-                        await self.fetch_school_info(province_code, curPage, False, retry + 1)
-                    else:
-                        # 自身IP也失败，记录错误并结束程序
-                        error_info = f"省份代码: {province_code}, 当前页: {curPage}, 错误: {e}"
-                        self.proxy_manager.record_direct_ip_failure(error_info)
-                        print("自身IP也失败，程序退出")
-                        sys.exit(1)
-            else:
-                # 没有代理或已经是自身IP
-                if retry < 2:
-                    print(f"等待5秒后重试...")
-                    await asyncio.sleep(5)
-                    await self.fetch_school_info(province_code, curPage, False, retry + 1)
-                else:
-                    # 自身IP失败，记录错误并结束程序
-                    error_info = f"省份代码: {province_code}, 当前页: {curPage}, 错误: {e}"
-                    if self.proxy_manager:
-                        self.proxy_manager.record_direct_ip_failure(error_info)
-                    else:
-                        # 如果没有代理管理器，直接记录到文件
-                        with open('ip_failure.log', 'a', encoding='utf-8') as f:
-                            timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                            f.write(f"[{timestamp}] 自身IP失败: {error_info}\n")
-                    print("自身IP也失败，程序退出")
-                    sys.exit(1)
-        except Exception as e:
-            print(f"请求异常：{e}")
-            if retry < 3:
-                print(f"等待3秒后重试...")
+                await asyncio.sleep(delay)
+                continue
+            except Exception as e:
+                logger.warning(f"请求异常：{e}")
+                if retry >= 3:
+                    logger.error(f"请求失败，跳过{info.scope}")
+                    self._log_failure(info.unit, f'{info.name}_exception', f"{info.describe}, 错误: {e}", info.request)
+                    return None
+                logger.info(f"等待3秒后重试...")
                 await asyncio.sleep(3)
-                await self.fetch_school_info(province_code, curPage, False, retry + 1)
+                continue
+            if status != 200:
+                logger.warning(f"请求失败，状态码: {status}")
+                continue
+            msg = data.get('msg')
+            if msg == '访问太频繁':
+                # 限速器已经降速并暂停，直接重试即可
+                continue
+            if isinstance(msg, dict) and 'list' in msg:
+                return msg
+            if msg == '请登录':
+                await self.handle_login_prompt()
+            logger.warning("警告：msg字段不是dict或缺少list，内容如下：%s", data)
+            self._log_failure(info.unit, f'{info.name}_msg_type', str(data), info.request)
+            return None
+
+    async def _connection_failed(self, e, retry, info):
+        """
+        网络连接错误：使用代理时换一个代理重试（出错的代理已记录失败，下次选代理时会被跳过）。
+        返回重试前等待的秒数，放弃时写入失败日志并返回None，自身IP也连不上时结束程序
+        """
+        logger.warning(f"网络连接错误：{e}")
+        if self.proxy_manager and self.proxy_manager.should_use_proxy():
+            if retry < 3:
+                logger.info(f"等待5秒后换一个代理重试...")
+                return 5
+            logger.error(f"网络连接失败，跳过{info.scope}")
+            self._log_failure(info.unit, f'{info.name}_network_error', info.describe, info.request)
+            return None
+        if retry < 2:
+            # 没有代理或已经是自身IP
+            logger.info(f"等待5秒后重试...")
+            return 5
+        # 自身IP也失败，记录错误并结束程序
+        error_info = f"{info.describe}, 错误: {e}"
+        if self.proxy_manager:
+            self.proxy_manager.record_direct_ip_failure(error_info)
+        else:
+            # 如果没有代理管理器，直接记录到文件
+            with open('ip_failure.log', 'a', encoding='utf-8') as f:
+                timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                f.write(f"[{timestamp}] 自身IP失败: {error_info}\n")
+        logger.error("自身IP也失败，程序退出")
+        sys.exit(1)
+
+    async def _pages(self, url, form_data, next_form, describe):
+        """
+        分页请求：依次产出每一页的msg，一页放弃时（失败已记录）不再请求后面的页。
+        next_form(form_data, msg) 生成下一页的表单，describe(form_data) 生成该页的 RequestInfo
+        """
+        while True:
+            msg = await self._request(url, form_data, describe(form_data))
+            if msg is None:
+                return
+            yield msg
+            if not self._has_next_page(msg):
+                return
+            form_data = next_form(form_data, msg)
+
+    @staticmethod
+    def _has_next_page(msg):
+        # 没有数据的页即使标记了 nextPageAvailable 也不再翻页，否则会一直请求同一个位置
+        return bool(msg.get('nextPageAvailable') and msg['list'])
+
+    @staticmethod
+    def _next_list_page(form_data, msg):
+        # 学校列表、专业列表每页10条
+        next_form_data = dict(form_data)
+        curPage = int(form_data['curPage']) + 1
+        next_form_data['curPage'] = str(curPage)
+        next_form_data['start'] = str((curPage - 1) * 10)
+        return next_form_data
+
+    @staticmethod
+    def _next_detail_page(form_data, msg):
+        next_form_data = dict(form_data)
+        # 按实际返回条数前进，服务端限制了每页条数时也不会跳过数据
+        next_form_data['start'] = str(int(form_data['start']) + len(msg['list']))
+        next_form_data['totalCount'] = str(msg.get('totalCount') or form_data['totalCount'])
+        return next_form_data
+
+    # 爬取指定省份地区的学校信息
+    async def fetch_school_info(self, province_code, curPage=1):
+        unit = province_unit(province_code)
+        try:
+            await self._fetch_school_info(province_code, curPage)
+        except BaseException:
+            self.checkpoint.fail(unit)
+            raise
+        finally:
+            await self.checkpoint.close(unit)
+
+    async def _fetch_school_info(self, province_code, curPage):
+        # 并发模式下多个省份共用同一个Crawler，每次请求复制一份表单
+        form_data = dict(self.form_data)
+        form_data['ssdm'] = province_code
+        form_data['curPage'] = str(curPage)
+        form_data['start'] = str((curPage - 1) * 10)
+
+        def describe(form):
+            return RequestInfo('fetch_school_info', province_unit(province_code),
+                               province_request(province_code, int(form['curPage'])),
+                               f"省份代码: {province_code}, 当前页: {form['curPage']}", '当前省份')
+
+        async for msg in self._pages(self.url, form_data, self._next_list_page, describe):
+            for item in msg['list']:
+                # 断点跳过逻辑
+                if not self.reached_school and self._at_breakpoint_province(province_code):
+                    if item.get('dwmc') == self.breakpoint.get('school_name'):
+                        self.reached_school = True  # 只在断点学校用专业断点
+                    else:
+                        continue
+                item['ssdm'] = province_code  # 补充省份代码
+                if self.checkpoint.is_done(school_unit(item)):
+                    continue
+                self.checkpoint.open(school_unit(item), parent=province_unit(province_code))
+                await self._dispatch('school', item)
+
+    async def fetch_school_major(self, obj, curPage=1, majors=None):
+        if majors is not None:
+            await self._fetch_school_major(obj, curPage, majors)
+            return
+        unit = school_unit(obj)
+        try:
+            if self.delta and curPage == 1:
+                if unit not in self.checkpoint.pending:
+                    self.checkpoint.open(unit)  # 日志重试等单独抓取的学校也要在成功后记录指纹
+                await self._fetch_school_delta(obj)
             else:
-                print("请求失败，跳过当前省份")
-                log_failed_request('fetch_school_info_exception', f"省份代码: {province_code}, 当前页: {curPage}, 错误: {e}", province_code=province_code)
-
-    async def fetch_school_major(self, obj, curPage=1, go_on=True, retry=0):
-        if retry > 5:
-            print("重试次数过多，放弃当前学校专业抓取")
-            info = f"学校: {obj.get('dwmc')}, 当前页: {curPage}, 断点: {self.breakpoint}"
-            log_failed_request('fetch_school_major', info, obj, province_code=obj.get('ssdm'))
+                await self._fetch_school_major(obj, curPage)
+        except BaseException:
+            self.checkpoint.fail(unit)
+            raise
+        finally:
+            await self.checkpoint.close(unit)
+
+    async def _fetch_school_delta(self, obj):
+        """
+        增量模式：先取完学校的专业列表，列表指纹没有变化时跳过整个学校，否则只抓取新增和变化的专业
+        """
+        majors = MajorList()
+        await self.fetch_school_major(obj, 1, majors=majors)
+        if not majors.complete:
+            return  # 列表没有取完整，失败已记录，下次重新比较
+        digest, hashes, changes = self.delta.compare(obj, majors)
+        if not changes:
             return
+        if str(obj.get('dwdm')) in self.delta.fingerprints:
+            logger.info(f"{obj.get('dwmc')}专业列表有变化：{len(changes)}项")
+        unit = school_unit(obj)
+
+        async def save():
+            await self.delta.save(obj, majors, digest, hashes, changes)
+
+        self.checkpoint.when_done(unit, save)
+        for change, key in changes:
+            if change == 'delete':
+                continue
+            item = majors.items[key]
+            self.checkpoint.open(major_unit(item), parent=unit)
+            await self._dispatch('major', item, majors.forms[key])
+
+    async def _fetch_school_major(self, obj, curPage, majors=None):
         form_data = {
             'dwdm': obj.get('dwdm'),
             'dwmc': obj.get('dwmc'),
@@ -216,385 +438,124 @@ class Crawler:
             'totalPage': '0',
             'totalCount': '0'
         }
-        try:
-            async with self.session.post('https://yz.chsi.com.cn/zsml/rs/dwzys.do', data=form_data) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if not data.get('flag'):
-                        msg = data.get('msg')
-                        if msg == '请登录':
-                            await self.handle_login_prompt()
-                        elif msg == '访问太频繁':
-                            wait_time = retry * 2
-                            print(f"访问太频繁，等待{wait_time}秒后重试……")
-                            await asyncio.sleep(wait_time)
-                            print("正在重试……")
-                            await do_sleep()
-                            await self.fetch_school_major(obj, curPage, False, retry + 1)
-                            return
-                        print(msg)
-                        print("警告：msg字段不是dict或缺少list，内容如下：", data)
-                        log_failed_request('fetch_school_major_msg_type', str(data), obj, province_code=obj.get('ssdm'))
-                        return
-                    else:
-                        msg = data.get('msg')
-                        if msg == '请登录':
-                            await self.handle_login_prompt()
-                            return
-                        elif msg == '访问太频繁':
-                            wait_time = retry * 2
-                            print(f"访问太频繁，等待{wait_time}秒后重试……")
-                            await asyncio.sleep(wait_time)
-                            print("正在重试……")
-                            await do_sleep()
-                            await self.fetch_school_major(obj, curPage, False, retry + 1)
-                            return
-                        if isinstance(msg, dict) and 'list' in msg:
-                            list_ = msg['list']
-                            for item in list_:
-                                major_code = item.get('zydm')
-                                # 断点跳过逻辑
-                                if not self.reached_major:
-                                    if major_code == self.breakpoint.get('major_code'):
-                                        self.reached_major = True
-                                    else:
-                                        continue
-                                await do_sleep()
-                                detail_form_data = {
-                                    'zydm': item.get('zydm'),
-                                    'zymc': item.get('zymc'),
-                                    'dwdm': item.get('dwdm'),
-                                    'xxfs': '',
-                                    'dwlxs': '',
-                                    'tydxs': '',
-                                    'jsggjh': '',
-                                    'start': '0',
-                                    'pageSize': '3',
-                                    'totalCount': '0'
-                                }
-
-                                await self._fetch_major_detail(item, detail_form_data)
-                        else:
-                            print("警告：msg字段不是dict或缺少list，内容如下：", data)
-                            log_failed_request('fetch_school_major_msg_type', str(data), obj, province_code=obj.get('ssdm'))
-                            return
-
-                    if data.get('msg') and isinstance(data.get('msg'), dict) and data.get('msg').get('nextPageAvailable') and go_on:
-                        await do_sleep()
-                        await self.fetch_school_major(obj, curPage + 1)
-                else:
-                    print(f"请求失败，状态码: {response.status}")
-                    await self.fetch_school_major(obj, curPage, False, retry + 1)
-        except aiohttp.ClientConnectorError as e:
-            print(f"网络连接错误：{e}")
-            if self.proxy_manager and self.proxy_manager.should_use_proxy():
-                print("尝试切换代理...")
-                new_proxy = await self.proxy_manager.switch_proxy()
-                if new_proxy:
-                    print(f"已切换到新代理: {new_proxy}")
-                    if retry < 3:
-                        print(f"等待5秒后重试...")
-                        await asyncio.sleep(5)
-                        await self.fetch_school_major(obj, curPage, False, retry + 1)
-                    else:
-                        print("网络连接失败，跳过当前学校")
-                        log_failed_request('fetch_school_major_network_error', f"学校: {obj.get('dwmc')}, 当前页: {curPage}", obj, province_code=obj.get('ssdm'))
-                else:
-                    # 所有代理都失败，使用自身IP
-                    print("所有代理都失败，尝试使用自身IP...")
-                    if retry < 2:  # 给自身IP一次重试机会
-                        await asyncio.sleep(3)
-                        await self.fetch_school_major(obj, curPage, False, retry + 1)
-                    else:
-                        # 自身IP也失败，记录错误并结束程序
-                        error_info = f"学校: {obj.get('dwmc')}, 当前页: {curPage}, 错误: {e}"
-                        self.proxy_manager.record_direct_ip_failure(error_info)
-                        print("自身IP也失败，程序退出")
-                        sys.exit(1)
-            else:
-                # 没有代理或已经是自身IP
-                if retry < 2:
-                    print(f"等待5秒后重试...")
-                    await asyncio.sleep(5)
-                    await self.fetch_school_major(obj, curPage, False, retry + 1)
-                else:
-                    # 自身IP失败，记录错误并结束程序
-                    error_info = f"学校: {obj.get('dwmc')}, 当前页: {curPage}, 错误: {e}"
-                    if self.proxy_manager:
-                        self.proxy_manager.record_direct_ip_failure(error_info)
+
+        def describe(form):
+            return RequestInfo('fetch_school_major', school_unit(obj), school_request(obj, int(form['curPage'])),
+                               f"学校: {obj.get('dwmc')}, 当前页: {form['curPage']}", '当前学校')
+
+        async for msg in self._pages(DWZYS_URL, form_data, self._next_list_page, describe):
+            for item in msg['list']:
+                major_code = item.get('zydm')
+                if majors is not None:
+                    majors.add(item, self._detail_form_data(item))
+                    continue
+                # 断点跳过逻辑
+                if not self.reached_major and self._at_breakpoint_school(obj):
+                    if major_code == self.breakpoint.get('major_code'):
+                        self.reached_major = True
                     else:
-                        # 如果没有代理管理器，直接记录到文件
-                        with open('ip_failure.log', 'a', encoding='utf-8') as f:
-                            timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                            f.write(f"[{timestamp}] 自身IP失败: {error_info}\n")
-                    print("自身IP也失败，程序退出")
-                    sys.exit(1)
-        except Exception as e:
-            print(f"请求异常：{e}")
-            if retry < 3:
-                print(f"等待3秒后重试...")
-                await asyncio.sleep(3)
-                await self.fetch_school_major(obj, curPage, False, retry + 1)
-            else:
-                print("请求失败，跳过当前学校")
-                log_failed_request('fetch_school_major_exception', f"学校: {obj.get('dwmc')}, 当前页: {curPage}, 错误: {e}", obj, province_code=obj.get('ssdm'))
-
-    async def _fetch_major_detail(self, item, detail_form_data, go_on=True, retry=0):
-        if retry > 5:
-            print("重试次数过多，放弃当前专业详情抓取")
-            info = f"专业: {item.get('zymc')}, 学校: {item.get('dwmc')}"
-            log_failed_request('fetch_major_detail', info, item, province_code=item.get('ssdm'))
-            return
+                        continue
+                detail_form_data = self._detail_form_data(item)
+                if self.checkpoint.is_done(major_unit(item)):
+                    continue
+                self.checkpoint.open(major_unit(item), parent=school_unit(obj))
+                await self._dispatch('major', item, detail_form_data)
+            if majors is not None and not self._has_next_page(msg):
+                majors.total_count = msg.get('totalCount')
+                majors.complete = True
+
+    @staticmethod
+    def _detail_form_data(item):
+        return {
+            'zydm': item.get('zydm'),
+            'zymc': item.get('zymc'),
+            'dwdm': item.get('dwdm'),
+            'xxfs': '',
+            'dwlxs': '',
+            'tydxs': '',
+            'jsggjh': '',
+            'start': '0',
+            'pageSize': str(DETAIL_PAGE_SIZE),
+            'totalCount': '0'
+        }
+
+    async def fetch_major(self, item, detail_form_data):
+        unit = major_unit(item)
         try:
-            async with self.session.post('https://yz.chsi.com.cn/zsml/rs/yjfxs.do',
-                                         data=detail_form_data) as detail_response:
-                if detail_response.status == 200:
-                    detail_data = await detail_response.json()
-
-                    if not detail_data.get('flag'):
-                        msg = detail_data.get('msg')
-                        if msg == '请登录':
-                            await self.handle_login_prompt()
-                        elif msg == '访问太频繁':
-                            wait_time = retry * 2
-                            print(f"访问太频繁，等待{wait_time}秒后重试……")
-                            await asyncio.sleep(wait_time)
-                            print("正在重试……")
-                            await do_sleep()
-                            await self._fetch_major_detail(item, detail_form_data, False, retry + 1)
-                            return
-                        if isinstance(msg, dict) and 'list' in msg:
-                            detail_list = msg['list']
-                            for detail_item in detail_list:
-                                detail_item['xwlxmc'] = item.get('xwlxmc')
-                                db.insert(detail_item)
-                        else:
-                            print("警告：msg字段不是dict或缺少list，内容如下：", detail_data)
-                            log_failed_request('fetch_major_detail_msg_type', str(detail_data), item, province_code=item.get('ssdm'))
-                            return
-                    else:
-                        msg = detail_data.get('msg')
-                        if msg == '请登录':
-                            await self.handle_login_prompt()
-                        elif msg == '访问太频繁':
-                            wait_time = retry * 2
-                            print(f"访问太频繁，等待{wait_time}秒后重试……")
-                            await asyncio.sleep(wait_time)
-                            print("正在重试……")
-                            await do_sleep()
-                            await self._fetch_major_detail(item, detail_form_data, False, retry + 1)
-                            return
-                        if isinstance(msg, dict) and 'list' in msg:
-                            detail_list = msg['list']
-                            for detail_item in detail_list:
-                                detail_item['xwlxmc'] = item.get('xwlxmc')
-                                db.insert(detail_item)
-                        else:
-                            print("警告：msg字段不是dict或缺少list，内容如下：", detail_data)
-                            log_failed_request('fetch_major_detail_msg_type', str(detail_data), item, province_code=item.get('ssdm'))
-                            return
-                else:
-                    print(f"详情请求失败，状态码: {detail_response.status}")
-                    await self._fetch_major_detail(item, detail_form_data, False, retry + 1)
-        except aiohttp.ClientConnectorError as e:
-            print(f"网络连接错误：{e}")
-            if self.proxy_manager and self.proxy_manager.should_use_proxy():
-                print("尝试切换代理...")
-                new_proxy = await self.proxy_manager.switch_proxy()
-                if new_proxy:
-                    print(f"已切换到新代理: {new_proxy}")
-                    if retry < 3:
-                        print(f"等待5秒后重试...")
-                        await asyncio.sleep(5)
-                        await self._fetch_major_detail(item, detail_form_data, False, retry + 1)
-                    else:
-                        print("网络连接失败，跳过当前请求")
-                        log_failed_request('fetch_major_detail_network_error', f"专业: {item.get('zymc')}, 学校: {item.get('dwmc')}", item, province_code=item.get('ssdm'))
-                else:
-                    # 所有代理都失败，使用自身IP
-                    print("所有代理都失败，尝试使用自身IP...")
-                    if retry < 2:  # 给自身IP一次重试机会
-                        await asyncio.sleep(3)
-                        await self._fetch_major_detail(item, detail_form_data, False, retry + 1)
-                    else:
-                        # 自身IP也失败，记录错误并结束程序
-                        error_info = f"专业: {item.get('zymc')}, 学校: {item.get('dwmc')}, 错误: {e}"
-                        self.proxy_manager.record_direct_ip_failure(error_info)
-                        print("自身IP也失败，程序退出")
-                        sys.exit(1)
-            else:
-                # 没有代理或已经是自身IP
-                if retry < 2:
-                    print(f"等待5秒后重试...")
-                    await asyncio.sleep(5)
-                    await self._fetch_major_detail(item, detail_form_data, False, retry + 1)
-                else:
-                    # 自身IP失败，记录错误并结束程序
-                    error_info = f"专业: {item.get('zymc')}, 学校: {item.get('dwmc')}, 错误: {e}"
-                    if self.proxy_manager:
-                        self.proxy_manager.record_direct_ip_failure(error_info)
-                    else:
-                        # 如果没有代理管理器，直接记录到文件
-                        with open('ip_failure.log', 'a', encoding='utf-8') as f:
-                            timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                            f.write(f"[{timestamp}] 自身IP失败: {error_info}\n")
-                    print("自身IP也失败，程序退出")
-                    sys.exit(1)
-        except Exception as e:
-            print(f"请求异常：{e}")
-            if retry < 3:
-                print(f"等待3秒后重试...")
-                await asyncio.sleep(3)
-                await self._fetch_major_detail(item, detail_form_data, False, retry + 1)
-            else:
-                print("请求失败，跳过当前请求")
-                log_failed_request('fetch_major_detail_exception', f"专业: {item.get('zymc')}, 学校: {item.get('dwmc')}, 错误: {e}", item, province_code=item.get('ssdm'))
+            await self._fetch_major_detail(item, detail_form_data)
+        except BaseException:
+            self.checkpoint.fail(unit)
+            raise
+        finally:
+            await self.checkpoint.close(unit)
 
+    async def _fetch_major_detail(self, item, detail_form_data):
+        def describe(form):
+            return RequestInfo('fetch_major_detail', major_unit(item), major_request(item, form),
+                               f"专业: {item.get('zymc')}, 学校: {item.get('dwmc')}", '当前请求')
 
-async def retry_failed_requests(school_instance, log_path='failed_requests.log'):
-    print('开始日志重试...')
-    try:
-        with open(log_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-    except FileNotFoundError:
-        print('日志文件未找到')
-        return
-    
-    print(f'日志文件共有 {len(lines)} 行内容')
-    
-    if not lines:
-        print('日志文件为空，无需重试')
+        # 研究方向超过一页时继续翻页，保证不漏数据
+        async for msg in self._pages(YJFXS_URL, detail_form_data, self._next_detail_page, describe):
+            for detail_item in msg['list']:
+                detail_item['xwlxmc'] = item.get('xwlxmc')
+                detail_item.setdefault('dwdm', item.get('dwdm'))  # 学校代码存入 school 维度表
+                await db.insert_async(detail_item)
+
+
+def _replay_unit(request):
+    """
+    重试覆盖了整个单元时返回该单元，重试成功后记为done：专业详情从失败的那一页继续，之前的页都已成功；
+    学校、省份从中间页重试时不包含前面页的下级单元，只记录重试到的下级单元的状态
+    """
+    kind = request['kind']
+    if kind == 'major':
+        return major_unit(request['item'])
+    if request['curPage'] != 1:
+        return None
+    if kind == 'school':
+        return school_unit(request['obj'])
+    return province_unit(request['province_code'])
+
+
+async def retry_failed_requests(crawler, concurrency=None):
+    """
+    重试失败日志中未解决的请求：多个请求并发执行（请求节奏仍由限速器控制），
+    重试后没有再次失败的请求标记为已解决
+    """
+    logger.info('开始日志重试...')
+    journal.load()
+    imported, skipped = journal.import_legacy()
+    if imported or skipped:
+        logger.info(f'已导入旧版失败日志：{imported}个请求，{skipped}行缺少请求参数无法重试（保留在 failed_requests.log.imported 中）')
+    entries = list(journal.entries.values())
+    if not entries:
+        logger.info('失败日志为空，无需重试')
         return
-        
-    retried = set()
-    lines_to_keep = []
-    retry_count = 0
-    
-    for line in lines:
-        if "错误原因: 重试次数过多" not in line:
-            lines_to_keep.append(line)
-            continue
-        handled = False
-        await asyncio.sleep(1)
-        # fetch_school_major/fetch_school_info
-        if '[fetch_school_major_no_flag]' in line or '[fetch_school_major_msg_type]' in line:
-            # print('日志原文:', line.strip())
-            m = re.search(r'\] \[fetch_school_major.*?\] (\{.*\})[\s\S]*错误原因', line)
-            if not m:
-                # print('正则未匹配到大括号内容')
-                lines_to_keep.append(line)
-                continue
-            # print('正则提取内容:', m.group(1))
+    concurrency = concurrency or config.get('failure_journal.concurrency', 4)
+    logger.info(f'失败日志中共有{len(entries)}个未解决的请求，重试并发数：{concurrency}')
+
+    # 重试不受断点影响，所有请求共用同一个不带断点的Crawler
+    replayer = type(crawler)(crawler.session, proxy_manager=crawler.proxy_manager, checkpoint=crawler.checkpoint,
+                             delta=crawler.delta)
+    semaphore = asyncio.Semaphore(concurrency)
+    resolved = 0
+
+    async def replay(entry):
+        nonlocal resolved
+        unit = _replay_unit(entry['request'])
+        if unit is not None:
+            # 登记单元，重试成功时更新 crawl_state，续爬时不再重复抓取
+            replayer.checkpoint.open(unit)
+        async with semaphore:
             try:
-                info = ast.literal_eval(m.group(1))
+                await replayer.replay(entry['request'])
             except Exception as e:
-                # print('ast.literal_eval 失败:', e)
-                lines_to_keep.append(line)
-                continue
-            dwdm = info.get('zsmlcxModel', {}).get('dwdm')
-            dwmc = info.get('zsmlcxModel', {}).get('dwmc')
-            curPage = int(info.get('params', {}).get('curPage', ['1'])[0])
-            zydm = info.get('zsmlcxModel', {}).get('zydm', '')
-            zymc = info.get('zsmlcxModel', {}).get('zymc', '')
-            key = (dwdm, dwmc, curPage)
-            if key in retried:
-                continue
-            # 判断是school级别还是major级别
-            if (not zydm and not zymc) or (zydm == '' and zymc == ''):
-                # school级别，重试fetch_school_info
-                # 优先从 info 结构和日志字符串中获取 province_code 或 ssdm
-                # print('日志原文:', line.strip())
-                # print('正则提取内容:', m.group(1))
-                province_code = None
-                # 1. 尝试从 zsmlcxModel.ssdm 获取
-                province_code = info.get('zsmlcxModel', {}).get('ssdm')
-                # print('zsmlcxModel.ssdm:', province_code)
-                # 2. 如果没有，再尝试从日志字符串中正则提取 province_code: xx
-                if not province_code:
-                    m2 = re.search(r'province_code: (\d+)', line)
-                    if m2:
-                        province_code = m2.group(1)
-                # print('最终用于重试的 province_code:', province_code)
-                # 3. 如果还没有，提示并跳过
-                if not province_code:
-                    print(f'无法获取省份代码，跳过该school级别日志：{line.strip()}')
-                    lines_to_keep.append(line)
-                    continue
-                # print(f'重试日志失败请求（school级别）：学校={dwmc}, dwdm={dwdm}, 当前页={curPage}, 省份代码={province_code}')
-                try:
-                    retry_crawler = type(school_instance)(school_instance.session, breakpoint={}, proxy_manager=school_instance.proxy_manager)
-                    retry_crawler.login_prompt_count = 0  # 重置登录提示计数
-                    await retry_crawler.fetch_school_info(province_code, curPage, target_school_code=dwdm)
-                    handled = True
-                    retry_count += 1
-                except Exception as e:
-                    print(f'重试失败：{e}')
-                    lines_to_keep.append(line)
-                    continue
-            else:
-                # major级别，重试fetch_school_major
-                # print(f'重试日志失败请求（major级别）：学校={dwmc}, dwdm={dwdm}, 当前页={curPage}')
-                obj = {'dwdm': dwdm, 'dwmc': dwmc}
-                retry_crawler = type(school_instance)(school_instance.session, breakpoint={}, proxy_manager=school_instance.proxy_manager)
-                retry_crawler.login_prompt_count = 0  # 重置登录提示计数
-                try:
-                    await retry_crawler.fetch_school_major(obj, curPage)
-                    handled = True
-                    retry_count += 1
-                except Exception as e:
-                    print(f'重试失败：{e}')
-                    lines_to_keep.append(line)
-                    continue
-            retried.add(key)
-        # fetch_major_detail
-        elif '[fetch_major_detail_no_flag]' in line or '[fetch_major_detail_msg_type]' in line:
-            m = re.search(r'\] \[fetch_major_detail.*?\] (\{.*\})(?:, xwlxmc: (.*?))?，错误原因', line)
-            if m:
-                try:
-                    info = ast.literal_eval(m.group(1))
-                except Exception:
-                    lines_to_keep.append(line)
-                    continue
-                xwlxmc = m.group(2) if m.group(2) else ''
-                params = info.get('params', {})
-                item = {
-                    'zydm': params.get('zydm', [''])[0],
-                    'zymc': params.get('zymc', [''])[0],
-                    'dwdm': params.get('dwdm', [''])[0],
-                    'xwlxmc': xwlxmc,
-                }
-                detail_form_data = {
-                    'zydm': params.get('zydm', [''])[0],
-                    'zymc': params.get('zymc', [''])[0],
-                    'dwdm': params.get('dwdm', [''])[0],
-                    'xxfs': params.get('xxfs', [''])[0],
-                    'dwlxs': params.get('dwlxs', [''])[0] if 'dwlxs' in params else '',
-                    'tydxs': params.get('tydxs', [''])[0],
-                    'jsggjh': params.get('jsggjh', [''])[0],
-                    'start': params.get('start', ['0'])[0],
-                    'pageSize': params.get('pageSize', ['3'])[0],
-                    'totalCount': params.get('totalCount', ['0'])[0]
-                }
-                key = (item['dwdm'], item['zydm'], item['zymc'])
-                if key in retried:
-                    continue
-                # print(f'重试日志失败请求：专业={item["zymc"]}, 学校代码={item["dwdm"]}, 专业代码={item["zydm"]}, 学位类型={item["xwlxmc"]}')
-                retry_crawler = type(school_instance)(school_instance.session, breakpoint={}, proxy_manager=school_instance.proxy_manager)
-                retry_crawler.login_prompt_count = 0  # 重置登录提示计数
-                try:
-                    await retry_crawler._fetch_major_detail(item, detail_form_data)
-                    handled = True
-                    retry_count += 1
-                except Exception as e:
-                    print(f'重试失败：{e}')
-                    lines_to_keep.append(line)
-                    continue
-                retried.add(key)
-        if not handled:
-            lines_to_keep.append(line)
-    
-    print(f'日志重试完成！共重试了 {retry_count} 个请求')
-    
-    # 写回未处理的日志
-    with open(log_path, 'w', encoding='utf-8') as f:
-        f.writelines(lines_to_keep)
+                logger.warning(f'重试失败：{e}')
+                return
+        if journal.resolve(entry):
+            resolved += 1
+
+    await asyncio.gather(*(replay(entry) for entry in entries))
+    # 去掉已解决的记录，避免日志越来越大
+    journal.compact()
+    logger.info(f'日志重试完成！共重试{len(entries)}个请求，成功{resolved}个，剩余{len(journal.entries)}个')
@@ -0,0 +1,97 @@
+import datetime
+import hashlib
+import json
+import logging
+
+from data import db
+
+logger = logging.getLogger('yzw.delta')
+
+
+def _sha1(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class MajorList:
+    """
+    一个学校完整的专业列表（dwzys.do 的所有分页）
+    """
+
+    def __init__(self):
+        self.items = {}  # 专业key -> 列表中的专业
+        self.forms = {}  # 专业key -> 专业详情的请求表单
+        self.total_count = None
+        self.complete = False  # 所有分页都已取到
+
+    def add(self, item, detail_form_data):
+        key = f"{item.get('zydm')}:{item.get('zymc')}"
+        # 同一专业可能以不同学位类型等出现多次
+        base, n = key, 2
+        while key in self.items:
+            key = f"{base}#{n}"
+            n += 1
+        self.items[key] = dict(item)
+        self.forms[key] = detail_form_data
+
+    def hashes(self):
+        return {key: _sha1(json.dumps(item, sort_keys=True, ensure_ascii=False)) for key, item in self.items.items()}
+
+    def digest(self, hashes):
+        lines = [str(self.total_count)] + sorted(f"{key}:{h}" for key, h in hashes.items())
+        return _sha1('\n'.join(lines))
+
+
+class DeltaTracker:
+    """
+    增量模式：用 totalCount 和各专业条目的哈希给每个学校的专业列表计算指纹，
+    指纹没变的学校跳过专业详情，变化的学校只抓取新增和变化的专业，并记录新增/变化/删除
+    """
+
+    def __init__(self, fingerprints=None):
+        self.fingerprints = fingerprints if fingerprints is not None else {}  # 学校代码 -> 上次的指纹
+        self.crawled_at = datetime.datetime.now()
+        self.unchanged = 0
+        self.changed = 0
+
+    @classmethod
+    def load(cls):
+        fingerprints = db.load_fingerprints()
+        logger.info(f"增量模式：读取到{len(fingerprints)}个学校的专业列表指纹")
+        return cls(fingerprints)
+
+    def compare(self, obj, majors):
+        """
+        返回 (指纹, 各专业哈希, 变化列表)，变化列表的元素为 (变化类型, 专业key)；指纹没变时变化列表为空
+        """
+        hashes = majors.hashes()
+        digest = majors.digest(hashes)
+        old = self.fingerprints.get(str(obj.get('dwdm')))
+        if old is None:
+            changes = [('insert', key) for key in hashes]
+        elif old['digest'] == digest:
+            changes = []
+        else:
+            old_hashes = old['majors']
+            changes = [('insert' if key not in old_hashes else 'update', key)
+                       for key, h in hashes.items() if old_hashes.get(key) != h]
+            changes += [('delete', key) for key in old_hashes if key not in hashes]
+        if changes:
+            self.changed += 1
+        else:
+            self.unchanged += 1
+        return digest, hashes, changes
+
+    async def save(self, obj, majors, digest, hashes, changes):
+        """
+        学校的专业详情全部抓取成功后再记录指纹，失败的学校下次会重新比较；
+        第一次记录指纹的学校只作为基准，不记录变化
+        """
+        school_code = str(obj.get('dwdm'))
+        rows = []
+        if school_code in self.fingerprints:
+            rows = [dict(school_code=school_code, school_name=obj.get('dwmc'), major_key=key, change_type=change,
+                         crawled_at=self.crawled_at) for change, key in changes]
+        self.fingerprints[school_code] = {'digest': digest, 'majors': hashes}
+        row = dict(school_code=school_code, school_name=obj.get('dwmc'), total_count=majors.total_count,
+                   digest=digest, majors=json.dumps(hashes, ensure_ascii=False), updated_at=datetime.datetime.now())
+        await db.save_fingerprint_async(row, rows)
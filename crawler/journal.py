@@ -0,0 +1,183 @@
+import ast
+import datetime
+import json
+import os
+import re
+
+from config import config
+
+
+def province_request(province_code, curPage):
+    return {'kind': 'province', 'province_code': province_code, 'curPage': curPage}
+
+
+def school_request(obj, curPage):
+    return {'kind': 'school', 'obj': obj, 'curPage': curPage}
+
+
+def major_request(item, detail_form_data):
+    return {'kind': 'major', 'item': item, 'form': detail_form_data}
+
+
+def request_key(request):
+    """
+    失败请求的唯一标识，同一个请求多次失败只保留一条记录
+    """
+    kind = request['kind']
+    if kind == 'province':
+        return f"province:{request['province_code']}:{request['curPage']}"
+    if kind == 'school':
+        return f"school:{request['obj'].get('dwdm')}:{request['curPage']}"
+    item, form = request['item'], request['form']
+    return f"major:{item.get('dwdm')}:{item.get('zydm')}:{item.get('zymc')}:{form.get('start')}"
+
+
+# 旧版本 failed_requests.log 的一行：[时间] [请求类型] 信息，错误原因: 重试次数过多
+LEGACY_LINE = re.compile(r'^\[[^\]]*\] \[(\w+)\] (.*)，错误原因: 重试次数过多$')
+
+
+def _first(params, name, default=''):
+    # 旧日志中的params是 {参数名: [值]}
+    value = params.get(name)
+    return value[0] if value else default
+
+
+def legacy_request(request_type, info):
+    """
+    把旧版本失败日志的一行还原成请求，信息不足（如只记录了学校名称）时返回None
+    """
+    data = None
+    match = re.match(r'(\{.*\})', info)
+    if match:
+        try:
+            data = ast.literal_eval(match.group(1))
+        except (ValueError, SyntaxError):
+            data = None
+    if request_type.startswith('fetch_school_info'):
+        province = re.search(r'province_code: (\d+)', info)
+        page = re.search(r'当前页: (\d+)', info)
+        if province:
+            return province_request(province.group(1), int(page.group(1)) if page else 1)
+    elif request_type.startswith('fetch_school_major') and isinstance(data, dict):
+        model = data.get('zsmlcxModel') or {}
+        if model.get('dwdm'):
+            obj = {'dwdm': model['dwdm'], 'dwmc': model.get('dwmc')}
+            return school_request(obj, int(_first(data.get('params') or {}, 'curPage', '1')))
+    elif request_type.startswith('fetch_major_detail') and isinstance(data, dict):
+        params = data.get('params') or {}
+        xwlxmc = re.search(r'\}, xwlxmc: (.*?)(?:, province_code: \d+)?$', info)
+        item = {
+            'dwdm': _first(params, 'dwdm'),
+            'dwmc': (data.get('zsmlcxModel') or {}).get('dwmc'),
+            'zydm': _first(params, 'zydm'),
+            'zymc': _first(params, 'zymc'),
+            'xwlxmc': xwlxmc.group(1) if xwlxmc else '',
+        }
+        if item['dwdm'] and item['zydm']:
+            form = {name: _first(params, name) for name in ('zydm', 'zymc', 'dwdm', 'xxfs', 'dwlxs', 'tydxs', 'jsggjh')}
+            form.update(start=_first(params, 'start', '0'), pageSize=_first(params, 'pageSize', '3'),
+                        totalCount=_first(params, 'totalCount', '0'))
+            return major_request(item, form)
+    return None
+
+
+class FailureJournal:
+    """
+    失败请求日志（JSONL，只追加）：每行是一次失败请求的完整参数，重试成功后追加一行 resolved 标记。
+    读取时按请求key合并，同一个key以最后一行为准
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}  # key -> 未解决的失败记录
+
+    def load(self):
+        entries = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # 程序中断时可能留下写了一半的行
+                    if record.get('resolved'):
+                        entries.pop(record['key'], None)
+                    else:
+                        entries[record['key']] = record
+        except FileNotFoundError:
+            pass
+        self.entries = entries
+        return entries
+
+    def record(self, request_type, info, request):
+        key = request_key(request)
+        old = self.entries.get(key)
+        record = {
+            'key': key,
+            'time': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'type': request_type,
+            'info': info,
+            'attempts': old['attempts'] + 1 if old else 1,
+            'request': request,
+        }
+        self.entries[key] = record
+        self._append(record)
+
+    def resolve(self, entry):
+        """
+        重试后该请求没有再次失败时标记为已解决，返回是否标记成功
+        """
+        if self.entries.get(entry['key']) is not entry:
+            return False
+        del self.entries[entry['key']]
+        self._append({'key': entry['key'], 'time': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                      'resolved': True})
+        return True
+
+    def compact(self):
+        """
+        只保留未解决的记录，先写临时文件再替换，中途退出也不会损坏日志
+        """
+        if not os.path.exists(self.path):
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for record in self.entries.values():
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        os.replace(tmp_path, self.path)
+
+    def import_legacy(self, path=None):
+        """
+        一次性导入旧版本的 failed_requests.log（默认在本日志所在目录）：能还原出请求参数的行写入本日志，
+        导入后旧日志改名为 *.imported（无法还原的行仍保留在其中），下次不再读取。
+        返回 (导入的请求数, 无法还原的行数)
+        """
+        path = path or os.path.join(os.path.dirname(self.path), 'failed_requests.log')
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return 0, 0
+        imported, skipped = set(), 0
+        for line in lines:
+            match = LEGACY_LINE.match(line.strip())
+            request = legacy_request(*match.groups()) if match else None
+            if request is None:
+                skipped += 1
+                continue
+            key = request_key(request)
+            if key not in imported:
+                imported.add(key)
+                self.record(match.group(1), match.group(2), request)
+        os.replace(path, path + '.imported')
+        return len(imported), skipped
+
+    def _append(self, record):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+journal = FailureJournal(config.get('failure_journal.path', 'failed_requests.jsonl'))
@@ -1,27 +1,24 @@
+import logging
+
 import aiohttp
 from bs4 import BeautifulSoup
 from fake_useragent import UserAgent
 
+from config import config
+from crawler.session import create_session
+
+logger = logging.getLogger('yzw.login')
 
-# async def on_request_start(session, trace_config_ctx, params):
-#     print(f"请求开始: {params.method} {params.url}")
-#
-# async def on_request_end(session, trace_config_ctx, params):
-#     print(f"请求结束: {params.response.status} {params.response.url}")
-#
-# async def on_redirect(session, trace_config_ctx, params):
-#     print(f"重定向: {params.response.status} -> {params.response.headers.get('Location')}")
-#     for name, morsel in params.response.cookies.items():
-#         print(f"  {name} = {morsel.value}")
+LOGIN_URL = config.get('crawler.login_url', 'https://account.chsi.com.cn/passport/login?entrytype=yzgr&service=https%3A%2F%2Fyz.chsi.com.cn%2Fj_spring_cas_security_check')
 
 
 class Login:
     def __init__(self):
-        self.post_url = 'https://account.chsi.com.cn/passport/login?entrytype=yzgr&service=https%3A%2F%2Fyz.chsi.com.cn%2Fj_spring_cas_security_check'
+        self.post_url = LOGIN_URL
         self.headers = {
             'User-Agent': UserAgent().random,
-            'Referer': 'https://account.chsi.com.cn/passport/login?entrytype=yzgr&service=https%3A%2F%2Fyz.chsi.com.cn%2Fj_spring_cas_security_check',
-            'Origin': 'https://account.chsi.com.cn'
+            'Referer': LOGIN_URL,
+            'Origin': LOGIN_URL.split('/passport', 1)[0]
         }
 
     async def get_session(self, username, password) -> aiohttp.ClientSession:
@@ -33,14 +30,8 @@ class Login:
             'execution': '',
             '_eventId': 'submit'
         }
-        # 获取lt和execution
-
-        # trace_config = aiohttp.TraceConfig()
-        # trace_config.on_request_start.append(on_request_start)
-        # trace_config.on_request_end.append(on_request_end)
-        # trace_config.on_request_redirect.append(on_redirect)
-        # session = aiohttp.ClientSession(headers=headers, trace_configs=[trace_config])
-        session = aiohttp.ClientSession(headers=self.headers)
+        # 获取lt和execution（登录请求的耗时可以用 config.yaml 的 trace 记录）
+        session = create_session(headers=self.headers)
         response = await session.get(self.post_url)
 
         html = await response.text()
@@ -55,39 +46,49 @@ class Login:
         # 登录
         response = await session.post(self.post_url, data=form_data)
         if response.status == 200:
-            print("登录完毕（本系统不会强行验证是否正确，自行确认账号密码正确性，错误会导致后续数据遗漏等问题）")
+            logger.info("登录完毕（本系统不会强行验证是否正确，自行确认账号密码正确性，错误会导致后续数据遗漏等问题）")
         else:
-            print("登录失败")
-            print(await response.text())
+            logger.error("登录失败：%s", await response.text())
 
         return session
 
-    async def do_login(self):
-        username = ''
-        password = ''
-        session = None
+    @staticmethod
+    def ask_credentials(method=None, username=None, password=None, cookie=None):
+        """
+        补全登录参数，缺少的部分在运行时询问
+        method: 'password' 或 'cookie'
+        """
+        if not method:
+            print("请选择登录方式：（输出对于数字即可）")
+            print("1. 输入账号密码登录")
+            print("2. 输入cookie登录")
+            choice = input("选择：")
+            method = 'password' if choice == '1' else 'cookie'
+
+        if method == 'password':
+            if not username or not password:
+                print("请输入下面信息！")
+                username = username or input("账号：")
+                password = password or input("密码：")
+        else:
+            cookie = cookie or input("请输入cookie字符串: ")
 
-        print("请选择登录方式：（输出对于数字即可）")
-        print("1. 输入账号密码登录")
-        print("2. 输入cookie登录")
-        choice = input("选择：")
+        return {'method': method, 'username': username, 'password': password, 'cookie': cookie}
 
-        if choice == '1':
-            print("请输入下面信息！")
-            username = input("账号：")
-            password = input("密码：")
+    async def do_login(self, method=None, username=None, password=None, cookie=None):
+        credentials = self.ask_credentials(method, username, password, cookie)
+
+        if credentials['method'] == 'password':
             # 创建登录实例
-            session = await self.get_session(username, password)
+            session = await self.get_session(credentials['username'], credentials['password'])
 
         else:
-            cookie_str = input("请输入cookie字符串: ")
-
             cookies = {}
-            for pair in cookie_str.split(';'):
+            for pair in credentials['cookie'].split(';'):
                 if '=' in pair:
                     key, value = pair.strip().split('=', 1)
                     cookies[key] = value
 
-            session = aiohttp.ClientSession(cookies=cookies, headers=self.headers)
+            session = create_session(headers=self.headers, cookies=cookies)
 
         return session
@@ -0,0 +1,111 @@
+import asyncio
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+
+from config import config
+from crawler.metrics import metrics
+
+logger = logging.getLogger('yzw.progress')
+
+_listener = None
+_handlers = []
+
+
+def setup_logging():
+    """
+    日志经 QueueHandler 放入队列，由 QueueListener 的后台线程写到终端和日志文件，
+    抓取协程和数据库写入线程不会因为终端输出变慢而阻塞。
+    总级别为 logging.level，各模块的级别在 logging.levels 中单独设置（如 yzw.db: WARNING）
+    """
+    global _listener, _handlers
+    if _listener is not None:
+        return
+    formatter = logging.Formatter(config.get('logging.format', '%(asctime)s %(levelname)s %(message)s'),
+                                  datefmt='%H:%M:%S')
+    handlers = [logging.StreamHandler(sys.stdout)]  # 和 print 的提示信息输出到同一处
+    path = config.get('logging.file', '')
+    if path:
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        handlers.append(logging.FileHandler(path, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    root = logging.getLogger()
+    root.setLevel(config.get('logging.level', 'INFO'))
+    for name, level in (config.get('logging.levels', {}) or {}).items():
+        logging.getLogger(name).setLevel(level)
+    log_queue = queue.SimpleQueue()
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    _handlers = handlers
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    # 先于数据库写入线程的退出处理执行，之后的日志直接写出
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """
+    写完队列中剩余的日志并停止后台线程，之后的日志直接由各handler同步写出
+    """
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    _listener = None
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, logging.handlers.QueueHandler):
+            root.removeHandler(handler)
+    for handler in _handlers:
+        root.addHandler(handler)
+
+
+class ProgressReporter:
+    """
+    每隔 interval 秒输出一次进度：写入行数和速度、请求数、各省份已完成的学校数，代替逐条输出
+    """
+
+    def __init__(self, crawler, writer, interval=30):
+        self.crawler = crawler
+        self.writer = writer
+        self.interval = interval
+        self._task = None
+        self._last = (time.monotonic(), 0)
+
+    def start(self):
+        if self.interval and self._task is None:
+            self._last = (time.monotonic(), self.writer.written)
+            self._task = asyncio.create_task(self._loop())
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.report()
+
+    def report(self):
+        now, written = time.monotonic(), self.writer.written
+        last_time, last_written = self._last
+        self._last = (now, written)
+        rate = (written - last_written) / (now - last_time) if now > last_time else 0
+        schools = self.crawler.checkpoint.schools_done
+        names = self.crawler.province_names
+        provinces = '，'.join(f"{names.get(code, code)}{count}所" for code, count in schools.items())
+        logger.info(f"进度：已写入{written}行（{rate:.1f}行/秒），"
+                    f"请求{metrics.total('yzw_requests_total'):.0f}次，"
+                    f"待写入{self.writer.queue.qsize()}条；已完成学校：{provinces or '无'}")
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self.report()
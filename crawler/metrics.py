@@ -0,0 +1,282 @@
+import asyncio
+import bisect
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+from aiohttp import web
+
+from config import config
+
+logger = logging.getLogger('yzw.metrics')
+
+# 请求、限速等待、数据库写入耗时的直方图分桶，单位：秒
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+HELP = {
+    'yzw_requests_total': '各接口的请求数，outcome：ok/throttle/login/http_状态码/error/cache_hit',
+    'yzw_request_seconds': '各接口请求的网络耗时（不含限速和并发等待）',
+    'yzw_retries_total': '各接口的重试次数',
+    'yzw_failures_total': '写入失败日志的请求数',
+    'yzw_rate_limiter_wait_seconds': '请求发出前在限速器中等待的时间',
+    'yzw_rate_limiter_rate': '限速器当前速率（次/秒）',
+    'yzw_db_write_seconds': '每批数据写入数据库的耗时',
+    'yzw_db_rows_total': '写入 major 表的行数，result：inserted/updated/unchanged',
+    'yzw_db_backpressure_seconds_total': '写入队列已满时抓取协程等待的总时间',
+    'yzw_db_queue_size': '写入队列中等待写入的数据条数',
+    'yzw_proxy_requests_total': '各代理的成功/失败次数（包括后台检测）',
+    'yzw_proxy_success_rate': '各代理成功率的滑动平均',
+    'yzw_proxy_latency_seconds': '各代理延迟的滑动平均',
+}
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一个是 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """
+        按分桶估算分位数（返回所在分桶的上界）
+        """
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= target:
+                return bound
+        return float('inf')
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in items) + '}'
+
+
+class Metrics:
+    """
+    进程内的指标：计数器、直方图和在输出时才读取的采集函数（限速器速率、代理统计等）。
+    抓取协程和数据库写入线程都会更新，所以用锁保护
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = defaultdict(float)  # (名称, 标签) -> 值
+        self.histograms = {}  # (名称, 标签) -> Histogram
+        self.collectors = []  # 返回 [(名称, 标签dict, 值[, 类型]), ...] 的函数，类型默认为 gauge
+        self.started = time.monotonic()
+
+    def inc(self, name, value=1, **labels):
+        with self.lock:
+            self.counters[(name, _labels(labels))] += value
+
+    def observe(self, name, value, **labels):
+        key = (name, _labels(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def _collected(self):
+        samples = []
+        for collector in self.collectors:
+            try:
+                samples.extend(collector())
+            except Exception as e:
+                logger.warning(f"读取指标失败：{e}")
+        return samples
+
+    def render(self):
+        """
+        Prometheus 文本格式
+        """
+        lines = []
+        described = set()
+
+        def describe(name, kind):
+            if name not in described:
+                described.add(name)
+                if name in HELP:
+                    lines.append(f'# HELP {name} {HELP[name]}')
+                lines.append(f'# TYPE {name} {kind}')
+
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, (h.buckets, list(h.counts), h.sum, h.count))
+                                for key, h in self.histograms.items())
+        for (name, labels), value in counters:
+            describe(name, 'counter')
+            lines.append(f'{name}{_format_labels(labels)} {value:g}')
+        for (name, labels), (buckets, counts, total, count) in histograms:
+            describe(name, 'histogram')
+            cumulative = 0
+            for bound, n in zip(list(buckets) + ['+Inf'], counts):
+                cumulative += n
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {total:g}')
+            lines.append(f'{name}_count{_format_labels(labels)} {count}')
+        # 同一指标的样本必须连续输出，采集函数按代理等逐个返回时先按名称分组（排序是稳定的）
+        for name, labels, value, *kind in sorted(self._collected(), key=lambda sample: sample[0]):
+            describe(name, kind[0] if kind else 'gauge')
+            lines.append(f'{name}{_format_labels(_labels(labels))} {value:g}')
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        """
+        JSON格式的快照，直方图只保留次数、总和和 p50/p99
+        """
+        def key(name, labels):
+            return name + ''.join(f'|{k}={v}' for k, v in labels)
+
+        with self.lock:
+            counters = {key(name, labels): value for (name, labels), value in self.counters.items()}
+            histograms = {
+                key(name, labels): {'count': h.count, 'sum': round(h.sum, 6),
+                                    'p50': h.quantile(0.5), 'p99': h.quantile(0.99)}
+                for (name, labels), h in self.histograms.items()
+            }
+        gauges = {key(name, _labels(labels)): value for name, labels, value, *_ in self._collected()}
+        return {
+            'time': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'uptime': round(time.monotonic() - self.started, 3),
+            'counters': counters,
+            'histograms': histograms,
+            'gauges': gauges,
+        }
+
+    def total(self, name):
+        """
+        同名计数器或直方图所有标签的总和
+        """
+        with self.lock:
+            return (sum(v for (n, _), v in self.counters.items() if n == name) +
+                    sum(h.sum for (n, _), h in self.histograms.items() if n == name))
+
+    def time_breakdown(self):
+        """
+        时间都花在了哪里：限速等待、网络请求和数据库写入的累计秒数（并发时会超过实际用时）
+        """
+        return {
+            'rate_limiter_wait': round(self.total('yzw_rate_limiter_wait_seconds'), 3),
+            'network': round(self.total('yzw_request_seconds'), 3),
+            'db_write': round(self.total('yzw_db_write_seconds'), 3),
+            'db_backpressure': round(self.total('yzw_db_backpressure_seconds_total'), 3),
+        }
+
+
+class MetricsExporter:
+    """
+    输出指标：port 不为0时在本地启动HTTP服务（/metrics 为Prometheus格式，/metrics.json 为JSON），
+    snapshot_path 不为空时每隔 snapshot_interval 秒向该文件追加一行JSON快照
+    """
+
+    def __init__(self, metrics, host='127.0.0.1', port=0, snapshot_path='', snapshot_interval=60):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self._runner = None
+        self._task = None
+
+    @classmethod
+    def from_config(cls, metrics, shard=None):
+        """
+        多进程模式下每个进程使用 端口+进程编号，快照文件名加上进程编号
+        """
+        port = config.get('metrics.port', 9108) or 0
+        path = config.get('metrics.snapshot_path', '') or ''
+        if shard is not None:
+            port = port + shard if port else 0
+            if path:
+                root, ext = os.path.splitext(path)
+                path = f'{root}-{shard}{ext}'
+        return cls(metrics, host=config.get('metrics.host', '127.0.0.1'), port=port, snapshot_path=path,
+                   snapshot_interval=config.get('metrics.snapshot_interval', 60))
+
+    async def start(self):
+        if self.port:
+            app = web.Application()
+            app.router.add_get('/metrics', self._metrics)
+            app.router.add_get('/metrics.json', self._metrics_json)
+            self._runner = web.AppRunner(app, access_log=None)
+            await self._runner.setup()
+            try:
+                await web.TCPSite(self._runner, self.host, self.port).start()
+                logger.info(f"指标服务已启动：http://{self.host}:{self.port}/metrics")
+            except OSError as e:
+                logger.warning(f"指标服务启动失败（端口{self.port}）：{e}")
+                await self._runner.cleanup()
+                self._runner = None
+        if self.snapshot_path:
+            self._task = asyncio.create_task(self._snapshot_loop())
+
+    async def _metrics(self, request):
+        return web.Response(text=self.metrics.render(), content_type='text/plain', charset='utf-8')
+
+    async def _metrics_json(self, request):
+        return web.json_response(self.metrics.snapshot())
+
+    def write_snapshot(self):
+        if os.path.dirname(self.snapshot_path):
+            os.makedirs(os.path.dirname(self.snapshot_path), exist_ok=True)
+        with open(self.snapshot_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(self.metrics.snapshot(), ensure_ascii=False) + '\n')
+
+    async def _snapshot_loop(self):
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            try:
+                self.write_snapshot()
+            except OSError as e:
+                logger.warning(f"写入指标快照失败：{e}")
+
+    async def close(self):
+        """
+        停止HTTP服务和定时快照，结束前再写一次快照
+        """
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            try:
+                self.write_snapshot()
+            except OSError as e:
+                logger.warning(f"写入指标快照失败：{e}")
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+# 全局共享的指标
+metrics = Metrics()
@@ -0,0 +1,83 @@
+import asyncio
+import logging
+import random
+import time
+
+from config import config
+from crawler.metrics import metrics
+
+logger = logging.getLogger('yzw.rate_limiter')
+
+
+class RateLimiter:
+    """
+    全局自适应限速器（AIMD）
+    请求成功时线性提高速率，遇到"访问太频繁"或网络错误时按比例降速，
+    所有请求（包括并发任务）共用同一个实例，也就共用同一份请求预算
+    """
+
+    def __init__(self, initial_rate=1.0, min_rate=0.2, max_rate=10.0, increase=0.05, decrease=0.5, cooldown=5,
+                 max_cooldown=300):
+        self.rate = initial_rate  # 当前速率，单位：次/秒
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase  # 每次成功后增加的速率
+        self.decrease = decrease  # 限流/网络错误时速率乘以该系数
+        self.cooldown = cooldown  # 限流后全部请求暂停的秒数，连续限流时翻倍
+        self.max_cooldown = max_cooldown
+        self.throttle_streak = 0  # 连续限流次数
+        self._next_time = 0.0  # 下一个请求允许发出的时间点
+        self._paused_until = 0.0  # 本次限流暂停的结束时间点
+
+    @classmethod
+    def from_config(cls):
+        interval = config.get('interval.seconds', 1) or 1
+        rate_limit = config.get('rate_limit', {}) or {}
+        return cls(
+            initial_rate=1 / interval,
+            min_rate=rate_limit.get('min_rate', 0.2),
+            max_rate=rate_limit.get('max_rate', 10),
+            increase=rate_limit.get('increase', 0.05),
+            decrease=rate_limit.get('decrease', 0.5),
+            cooldown=rate_limit.get('cooldown', 5),
+            max_cooldown=rate_limit.get('max_cooldown', 300),
+        )
+
+    async def acquire(self):
+        """
+        每个请求发出前调用：按当前速率预约一个发送时间点并等待到该时间点
+        """
+        now = time.monotonic()
+        send_at = max(now, self._next_time)
+        # 保留随机抖动，避免请求间隔过于规律
+        self._next_time = send_at + random.uniform(0.8, 1.2) / self.rate
+        metrics.observe('yzw_rate_limiter_wait_seconds', send_at - now)
+        if send_at > now:
+            await asyncio.sleep(send_at - now)
+
+    def on_success(self):
+        self.throttle_streak = 0
+        self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self):
+        """
+        遇到"访问太频繁"：速率按比例下降，并让所有请求暂停一段时间。
+        暂停期间收到的限流响应来自暂停前已经发出的并发请求，属于同一次限流，不再重复降速
+        """
+        now = time.monotonic()
+        if now < self._paused_until:
+            return
+        self.throttle_streak += 1
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+        pause = min(self.max_cooldown, self.cooldown * 2 ** (self.throttle_streak - 1))
+        self._paused_until = now + pause
+        self._next_time = max(self._next_time, self._paused_until)
+        logger.warning(f"访问太频繁，速率降至{self.rate:.2f}次/秒，暂停{pause}秒后重试……")
+
+    def on_error(self):
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+
+
+# 全局共享的限速器实例
+rate_limiter = RateLimiter.from_config()
+metrics.add_collector(lambda: [('yzw_rate_limiter_rate', {}, rate_limiter.rate)])
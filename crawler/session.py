@@ -0,0 +1,29 @@
+import aiohttp
+
+from config import config
+from crawler.trace import tracer
+
+
+def create_session(headers=None, cookies=None) -> aiohttp.ClientSession:
+    """
+    创建爬取用的session，连接池、超时、DNS缓存和压缩方式均可在 config.yaml 的 session 部分配置，
+    启用 trace 时记录每个请求各阶段的耗时
+    """
+    connector = aiohttp.TCPConnector(
+        limit=config.get('session.limit', 100),
+        limit_per_host=config.get('session.limit_per_host', 20),
+        keepalive_timeout=config.get('session.keepalive_timeout', 30),
+        ttl_dns_cache=config.get('session.ttl_dns_cache', 300),
+    )
+    # 防止连接卡死导致整个爬取流程无限等待
+    timeout = aiohttp.ClientTimeout(
+        total=config.get('session.timeout.total', 60),
+        connect=config.get('session.timeout.connect', 10),
+        sock_read=config.get('session.timeout.read', 30),
+    )
+    headers = dict(headers or {})
+    accept_encoding = config.get('session.accept_encoding', 'gzip, deflate')
+    if accept_encoding:
+        headers['Accept-Encoding'] = accept_encoding
+    return aiohttp.ClientSession(connector=connector, timeout=timeout, headers=headers, cookies=cookies,
+                                 trace_configs=tracer.trace_configs())
@@ -0,0 +1,200 @@
+import atexit
+import json
+import logging
+import os
+import time
+
+import aiohttp
+
+from config import config
+
+logger = logging.getLogger('yzw.trace')
+
+
+class Tracer:
+    """
+    基于 aiohttp.TraceConfig 的请求耗时分析（默认关闭）：记录每个请求各阶段的耗时，每个请求一行写入JSONL文件，
+    用 trace_summary.py 汇总。各阶段（毫秒）：
+    queued 等待连接池空位，dns 域名解析，connect 建立连接（TCP+TLS，使用代理时包括与代理的连接），
+    send 发送请求，ttfb 请求发出到收到响应头，body 读取响应体（只有 Crawler._post 的请求有）。
+    发生重定向时各阶段为所有跳转之和，redirects 记录跳转次数。
+    aiohttp 没有单独的TLS握手事件，TLS耗时包含在 connect 中
+    """
+
+    def __init__(self, path, enabled=False):
+        self.path = path
+        self.enabled = enabled
+        self.count = 0
+        self._file = None
+
+    @classmethod
+    def from_config(cls):
+        return cls(config.get('trace.path', 'trace/requests.jsonl'), config.get('trace.enabled', False))
+
+    def use_shard(self, shard):
+        """
+        多进程模式下每个进程写入单独的文件，如 trace/requests-0.jsonl
+        """
+        root, ext = os.path.splitext(self.path)
+        self.path = f'{root}-{shard}{ext}'
+
+    def trace_configs(self):
+        """
+        创建session时使用，未启用时返回None
+        """
+        if not self.enabled:
+            return None
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(self._on_request_start)
+        trace_config.on_connection_queued_start.append(self._on_queued_start)
+        trace_config.on_connection_queued_end.append(self._on_queued_end)
+        trace_config.on_connection_create_start.append(self._on_create_start)
+        trace_config.on_connection_create_end.append(self._on_create_end)
+        trace_config.on_connection_reuseconn.append(self._on_reuseconn)
+        trace_config.on_dns_resolvehost_start.append(self._on_dns_start)
+        trace_config.on_dns_resolvehost_end.append(self._on_dns_end)
+        trace_config.on_request_headers_sent.append(self._on_headers_sent)
+        trace_config.on_request_redirect.append(self._on_redirect)
+        trace_config.on_request_end.append(self._on_request_end)
+        trace_config.on_request_exception.append(self._on_request_exception)
+        return [trace_config]
+
+    def request_context(self, endpoint, proxy=None):
+        """
+        Crawler._post 通过 trace_request_ctx 传入，读完响应体后调用 finish 写入记录
+        """
+        if not self.enabled:
+            return None
+        return {'endpoint': endpoint, 'proxy': proxy}
+
+    def finish(self, request_ctx, error=None):
+        if not request_ctx or 'ctx' not in request_ctx:
+            return
+        ctx = request_ctx['ctx']
+        if error is not None and ctx.error is None:
+            ctx.error = type(error).__name__
+        if ctx.headers_at is not None:
+            ctx.body = time.perf_counter() - ctx.headers_at
+        self._write(ctx)
+
+    # ---- TraceConfig 回调，时间点记录在 aiohttp 为每个请求创建的 trace_config_ctx 上 ----
+
+    async def _on_request_start(self, session, ctx, params):
+        if hasattr(ctx, 'started'):
+            return  # 重定向的后续跳转沿用同一个记录，保留前面各跳的耗时
+        ctx.wall = time.time()
+        ctx.started = ctx.hop_at = time.perf_counter()
+        ctx.hop_phases = 0  # 本跳开始时已累计的 queued+dns+connect
+        ctx.method = params.method
+        ctx.url = str(params.url.with_query(None))
+        ctx.queued = ctx.dns = ctx.connect = ctx.send = ctx.ttfb = ctx.body = None
+        ctx.sent_at = ctx.headers_at = None
+        ctx.reused = False
+        ctx.redirects = 0
+        ctx.status = None
+        ctx.error = None
+        ctx.written = False
+        if isinstance(ctx.trace_request_ctx, dict):
+            ctx.trace_request_ctx['ctx'] = ctx
+
+    async def _on_queued_start(self, session, ctx, params):
+        ctx.queued_at = time.perf_counter()
+
+    async def _on_queued_end(self, session, ctx, params):
+        ctx.queued = (ctx.queued or 0) + time.perf_counter() - ctx.queued_at
+
+    async def _on_create_start(self, session, ctx, params):
+        ctx.create_at = time.perf_counter()
+
+    async def _on_create_end(self, session, ctx, params):
+        # 域名解析发生在建立连接的过程中，这里扣除
+        ctx.connect = (ctx.connect or 0) + time.perf_counter() - ctx.create_at - (ctx.dns or 0)
+
+    async def _on_reuseconn(self, session, ctx, params):
+        ctx.reused = True
+
+    async def _on_dns_start(self, session, ctx, params):
+        ctx.dns_at = time.perf_counter()
+
+    async def _on_dns_end(self, session, ctx, params):
+        ctx.dns = (ctx.dns or 0) + time.perf_counter() - ctx.dns_at
+
+    async def _on_headers_sent(self, session, ctx, params):
+        ctx.sent_at = time.perf_counter()
+        # 本跳从开始到发出请求的时间，扣除本跳的排队、域名解析和建立连接
+        ctx.send = (ctx.send or 0) + ctx.sent_at - ctx.hop_at - (self._phases(ctx) - ctx.hop_phases)
+
+    async def _on_redirect(self, session, ctx, params):
+        # 收到跳转响应，本跳结束，下一跳从现在开始计时
+        now = time.perf_counter()
+        ctx.redirects += 1
+        if ctx.sent_at is not None:
+            ctx.ttfb = (ctx.ttfb or 0) + now - ctx.sent_at
+        ctx.sent_at = None
+        ctx.hop_at = now
+        ctx.hop_phases = self._phases(ctx)
+
+    async def _on_request_end(self, session, ctx, params):
+        ctx.headers_at = time.perf_counter()
+        if ctx.sent_at is not None:
+            ctx.ttfb = (ctx.ttfb or 0) + ctx.headers_at - ctx.sent_at
+        ctx.status = params.response.status
+        if not isinstance(ctx.trace_request_ctx, dict):
+            self._write(ctx)  # 登录等不经过 Crawler._post 的请求不记录读取响应体的时间
+
+    async def _on_request_exception(self, session, ctx, params):
+        ctx.error = type(params.exception).__name__
+        self._write(ctx)
+
+    @staticmethod
+    def _phases(ctx):
+        return (ctx.queued or 0) + (ctx.dns or 0) + (ctx.connect or 0)
+
+    def _write(self, ctx):
+        if ctx.written:
+            return
+        ctx.written = True
+        request_ctx = ctx.trace_request_ctx if isinstance(ctx.trace_request_ctx, dict) else {}
+        end = ctx.headers_at or time.perf_counter()
+
+        def ms(seconds):
+            return None if seconds is None else round(seconds * 1000, 2)
+
+        record = {
+            't': round(ctx.wall, 3),
+            'method': ctx.method,
+            'url': ctx.url,
+            'endpoint': request_ctx.get('endpoint'),
+            'proxy': request_ctx.get('proxy'),
+            'status': ctx.status,
+            'error': ctx.error,
+            'reused': ctx.reused,
+            'redirects': ctx.redirects,
+            'queued': ms(ctx.queued),
+            'dns': ms(ctx.dns),
+            'connect': ms(ctx.connect),
+            'send': ms(ctx.send),
+            'ttfb': ms(ctx.ttfb),
+            'body': ms(ctx.body),
+            'total': ms(end - ctx.started + (ctx.body or 0)),
+        }
+        try:
+            if self._file is None:
+                if os.path.dirname(self.path):
+                    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self._file = open(self.path, 'a', encoding='utf-8', buffering=64 * 1024)
+            self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self.count += 1
+        except OSError as e:
+            logger.warning(f"写入请求跟踪记录失败：{e}")
+            self.enabled = False
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+# 全局共享的请求跟踪
+tracer = Tracer.from_config()
+atexit.register(tracer.close)
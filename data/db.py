@@ -1,40 +1,99 @@
+import asyncio
+import atexit
+import contextlib
+import datetime
+import hashlib
+import json
 import logging
+import queue
+import threading
+import time
 
-
-from sqlalchemy import create_engine
-from sqlalchemy.exc import SQLAlchemyError, IntegrityError
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, select, tuple_
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import aliased, sessionmaker
 from config import config
+from crawler.metrics import metrics
 from data import entity
-from data.entity import Major
+from data.entity import (CrawlState, Department, Major, MajorChange, MajorListChange, School, SchoolFingerprint,
+                         Subject)
 
 database = config.get('database', {})
 
-DATABASE_URL = (
+# database.url 不为空时直接使用（如基准测试用的 sqlite:///bench.sqlite3），否则按各项配置连接MySQL
+DATABASE_URL = database.get('url') or (
     f"mysql+pymysql://{database.get('username')}:{database.get('password')}"
     f"@{database.get('host')}:{database.get('port')}/{database.get('name')}?charset=utf8mb4"
 )
 
 engine = create_engine(DATABASE_URL, echo=False)
 
+# 决定一条 major 数据身份的字段（content_hash 由它们计算），以及重新爬取时可能变化的字段
+UNIQUE_COLUMNS = ['department', 'research_direction', 'major_code', 'study_mode', 'exam_type', 'school_name',
+                  'exam_subject1', 'exam_subject2', 'exam_subject3', 'exam_subject4']
+MUTABLE_COLUMNS = ['major_name', 'degree_type', 'veteran_program', 'shaogu_program', 'advisor', 'planned_enrollment']
+# build_rows 中存入维度表、在 major 表中换成ID的字段
+DIMENSION_COLUMNS = ['school_name', 'school_code', 'province', 'department',
+                     'exam_subject1', 'exam_subject2', 'exam_subject3', 'exam_subject4']
+CRAWLED_AT = datetime.datetime.now()  # 本次爬取的时间，记录在 major_change 中
+
 Session = sessionmaker(bind=engine)
 logging.getLogger('sqlalchemy').setLevel(logging.ERROR)
 
+logger = logging.getLogger('yzw.db')
 
-def insert(item):
+
+def dialect_insert(table):
     """
-    插入 Major 实体数据
+    按数据库类型生成 INSERT 语句，除MySQL外也支持SQLite（用于基准测试）
     """
-    session = Session()
-    kskmz = item.get("kskmz")
-    for km in kskmz:
+    return sqlite_insert(table) if engine.dialect.name == 'sqlite' else mysql_insert(table)
+
+
+def insert_or_ignore(table, rows):
+    """
+    多行 INSERT IGNORE，违反唯一索引的行被忽略
+    """
+    stmt = dialect_insert(table).values(rows)
+    return stmt.prefix_with('OR IGNORE' if engine.dialect.name == 'sqlite' else 'IGNORE')
+
+
+def insert_or_update(table, rows, key_columns, update_columns):
+    """
+    多行插入，key_columns 唯一索引冲突时更新 update_columns
+    """
+    stmt = dialect_insert(table).values(rows)
+    if engine.dialect.name == 'sqlite':
+        return stmt.on_conflict_do_update(index_elements=key_columns,
+                                          set_={column: stmt.excluded[column] for column in update_columns})
+    return stmt.on_duplicate_key_update({column: stmt.inserted[column] for column in update_columns})
+
+
+def content_hash(row):
+    """
+    身份字段的MD5（16字节），major 表只在这一列上建唯一索引，代替原来10个varchar字段的联合唯一索引。
+    与 yzw.sql 中迁移语句的 UNHEX(MD5(CONCAT_WS(CHAR(31), IFNULL(字段, CHAR(0)), ...))) 结果一致
+    """
+    text = '\x1f'.join('\x00' if row.get(column) is None else str(row.get(column)) for column in UNIQUE_COLUMNS)
+    return hashlib.md5(text.encode('utf-8')).digest()
+
+
+def build_rows(item):
+    """
+    把一条专业详情拆成多行 major 数据（每个考试科目组合一行）
+    """
+    rows = []
+    for km in item.get("kskmz") or []:
         exam_subjects = ["", "", "", ""]
         exam_subjects[0] = km.get("km1Vo", {}).get("kskmmc", "")
         exam_subjects[1] = km.get("km2Vo", {}).get("kskmmc", "")
         exam_subjects[2] = km.get("km3Vo", {}).get("kskmmc", "")
         exam_subjects[3] = km.get("km4Vo", {}).get("kskmmc", "")
-        major = Major(
+        rows.append(dict(
             school_name=item.get("dwmc"),
+            school_code=item.get("dwdm"),
             major_name=item.get("zymc"),
             province=item.get("szss"),
             major_code=item.get("zydm"),
@@ -51,18 +110,482 @@ def insert(item):
             exam_subject2=exam_subjects[1],
             exam_subject3=exam_subjects[2],
             exam_subject4=exam_subjects[3],
-        )
+        ))
+    for row in rows:
+        row['content_hash'] = content_hash(row)
+    return rows
+
+
+def row_units(row):
+    """
+    一行 build_rows 数据所属的专业和学校单元，与 crawler.checkpoint 中的 major_unit/school_unit 一致
+    """
+    return {('major', f"{row.get('school_code')}:{row.get('major_code')}:{row.get('major_name')}"),
+            ('school', str(row.get('school_code')))}
+
+
+class DimensionError(SQLAlchemyError):
+    """
+    维度数据插入后仍查不到ID，写入这一批会把外键写成NULL，需要换一个新事务重试
+    """
+
+
+class Dimensions:
+    """
+    学校、院系所、考试科目维度表：major 表只保存它们的ID。
+    写入线程缓存已知的ID，每个学校/院系所/科目在一个进程中只插入和查询一次。
+    空字符串的考试科目也对应一行，导出时还原为空字符串而不是NULL
+    """
+
+    def __init__(self):
+        self.schools = {}  # (学校名称,) -> id
+        self.departments = {}  # (学校id, 院系所名称) -> id
+        self.subjects = {}  # (科目名称,) -> id
+        self.added = []  # 当前事务中新缓存的 (缓存, key)，事务回滚时丢弃
+
+    def resolve(self, conn, rows):
+        """
+        把一批 build_rows 的数据换成 major 表的行（学校、院系所、考试科目换成ID），
+        缓存中没有的维度数据在 major 数据的同一个事务中插入和查询
+        """
+        self._ensure(conn, School.__table__, self.schools, ['name'], {
+            (row['school_name'],): dict(name=row['school_name'], code=row.get('school_code'),
+                                        province=row.get('province'))
+            for row in rows if row.get('school_name')})
+        self._ensure(conn, Subject.__table__, self.subjects, ['name'], {
+            (row[column],): dict(name=row[column])
+            for row in rows for column in DIMENSION_COLUMNS[4:] if row.get(column) is not None})
+        departments = {}
+        for row in rows:
+            school_id = self.schools.get((row.get('school_name'),))
+            if school_id and row.get('department'):
+                departments[(school_id, row['department'])] = dict(school_id=school_id, name=row['department'])
+        self._ensure(conn, Department.__table__, self.departments, ['school_id', 'name'], departments)
+
+        result = []
+        for row in rows:
+            school_id = self.schools.get((row.get('school_name'),))
+            major_row = {column: value for column, value in row.items() if column not in DIMENSION_COLUMNS}
+            major_row['school_id'] = school_id
+            major_row['department_id'] = self.departments.get((school_id, row.get('department')))
+            for n in range(1, 5):
+                major_row[f'exam_subject{n}_id'] = self.subjects.get((row.get(f'exam_subject{n}'),))
+            result.append(major_row)
+        return result
+
+    def _ensure(self, conn, table, cache, key_columns, rows):
+        """
+        rows: {key: 行}，缓存中没有的先 INSERT IGNORE，再查出ID放入缓存；全部命中缓存时不访问数据库。
+        查询使用加锁读：MySQL 默认的可重复读隔离级别下，普通查询看不到事务开始后其他进程提交的行，
+        而 INSERT IGNORE 已经因为这些行被忽略
+        """
+        missing = {key: rows[key] for key in sorted(rows) if key not in cache}
+        if not missing:
+            return
+        # 按key的顺序插入，多进程同时插入相同的维度数据时加锁顺序一致
+        conn.execute(insert_or_ignore(table, list(missing.values())))
+        columns = [table.c[column] for column in key_columns]
+        if len(columns) == 1:
+            condition = columns[0].in_([key[0] for key in missing])
+        else:
+            condition = tuple_(*columns).in_(list(missing))
+        found = {}
+        for row in conn.execute(select(table.c.id, *columns).where(condition).with_for_update(read=True)):
+            found[tuple(row[1:])] = row[0]
+            # MySQL比较字符串不区分大小写，已有的行可能和本次的名称只差大小写
+            found.setdefault(self._fold(row[1:]), row[0])
+        unresolved = []
+        for key in missing:
+            id_ = found.get(key, found.get(self._fold(key)))
+            if id_ is None:
+                unresolved.append(key)
+                continue
+            cache[key] = id_
+            self.added.append((cache, key))
+        if unresolved:
+            raise DimensionError(f"{table.name} 表中查不到：{unresolved[:5]}")
+
+    @staticmethod
+    def _fold(key):
+        return tuple(value.casefold() if isinstance(value, str) else value for value in key)
+
+    def commit(self):
+        self.added = []
+
+    def rollback(self):
+        # 事务回滚后新插入的维度数据不存在了，缓存的ID也要丢弃
+        for cache, key in self.added:
+            cache.pop(key, None)
+        self.added = []
+
+
+def major_view():
+    """
+    把 major 表和维度表连接起来，列名与规范化之前的 major 表一致，供导出使用
+    """
+    subjects = [aliased(Subject, name=f'subject{n}') for n in range(1, 5)]
+    query = select(
+        Major.id,
+        School.name.label('school_name'),
+        Major.major_name,
+        School.province.label('province'),
+        Major.major_code,
+        Major.degree_type,
+        Major.exam_type,
+        Department.name.label('department'),
+        Major.study_mode,
+        Major.research_direction,
+        Major.veteran_program,
+        Major.shaogu_program,
+        Major.advisor,
+        Major.planned_enrollment,
+        *[subject.name.label(f'exam_subject{n}') for n, subject in enumerate(subjects, 1)],
+    ).select_from(Major).outerjoin(School, Major.school_id == School.id).outerjoin(
+        Department, Major.department_id == Department.id)
+    for n, subject in enumerate(subjects, 1):
+        query = query.outerjoin(subject, getattr(Major, f'exam_subject{n}_id') == subject.id)
+    return query
+
+
+def insert_ignore(rows):
+    return insert_or_ignore(Major.__table__, rows)
+
+
+def upsert_majors(conn, rows):
+    """
+    写入 major 数据：新数据直接插入，已存在的数据更新可变字段，并把每个变化的字段记录到 major_change。
+    返回 (去重后的行数, 新增行数, 有变化的行数)
+    """
+    # 同一批中 content_hash 相同的数据只保留最后一条
+    unique_rows = {row['content_hash']: row for row in rows}
+    rows = list(unique_rows.values())
+
+    table = Major.__table__
+    query = select(table.c.id, table.c.content_hash, *[table.c[column] for column in MUTABLE_COLUMNS]).where(
+        table.c.content_hash.in_(list(unique_rows)))
+    existing = {old['content_hash']: old for old in conn.execute(query).mappings()}
+
+    changes = []
+    changed_rows = 0
+    for row in rows:
+        old = existing.get(row['content_hash'])
+        if old is None:
+            continue
+        changed = [column for column in MUTABLE_COLUMNS if old[column] != row.get(column)]
+        changed_rows += bool(changed)
+        changes.extend(dict(major_id=old['id'], column_name=column, old_value=old[column], new_value=row.get(column),
+                            crawled_at=CRAWLED_AT) for column in changed)
+
+    conn.execute(insert_or_update(table, rows, ['content_hash'], MUTABLE_COLUMNS))
+    if changes:
+        conn.execute(dialect_insert(MajorChange.__table__).values(changes))
+    return len(rows), len(rows) - len(existing), changed_rows
+
+
+def upsert_states(states):
+    return insert_or_update(CrawlState.__table__, states, ['unit_type', 'unit_key'], ['status', 'updated_at'])
+
+
+def upsert_fingerprints(rows):
+    return insert_or_update(SchoolFingerprint.__table__, rows, ['school_code'],
+                            ['school_name', 'total_count', 'digest', 'majors', 'updated_at'])
+
+
+def insert_list_changes(rows):
+    return dialect_insert(MajorListChange.__table__).values(rows)
+
+
+class Record:
+    """
+    major 以外的数据（抓取状态、专业列表指纹等），和 major 数据走同一个写入队列，保证在之前提交的数据之后写入。
+    statement 根据多行数据生成写入语句，同一批中 key 相同的记录只保留最新一条
+    """
+    statement = None
+
+    def __init__(self, row, key=None):
+        self.row = row
+        self.key = key if key is not None else id(self)
+
+
+class UnitState(Record):
+    statement = staticmethod(upsert_states)
+
+    def __init__(self, unit_type, unit_key, status):
+        super().__init__(dict(unit_type=unit_type, unit_key=unit_key, status=status,
+                              updated_at=datetime.datetime.now()), key=(unit_type, unit_key))
+
+
+class Fingerprint(Record):
+    statement = staticmethod(upsert_fingerprints)
+
+    def __init__(self, row):
+        super().__init__(row, key=row['school_code'])
+
+
+class ListChange(Record):
+    statement = staticmethod(insert_list_changes)
+
+
+_FLUSH = object()  # 队列中的控制标记：立即写入缓冲区
+_STOP = object()  # 队列中的控制标记：写完后退出写入线程
+
+
+class BatchWriter:
+    """
+    后台写入线程：抓取协程只负责把专业详情放进有界队列，由独立线程取出后攒批，
+    达到 batch_size 条或距上次写入超过 flush_interval 秒时批量写入：
+    write_mode 为 ignore 时用一条多行 INSERT IGNORE（重复数据由唯一索引忽略），
+    为 upsert 时已存在的数据会更新可变字段并记录变化。
+    队列满时抓取协程会挂起等待，起到背压作用
+    """
+
+    def __init__(self, batch_size=500, flush_interval=10, queue_size=5000, write_mode='ignore'):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.write_mode = write_mode
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.rows = []
+        self.records = {}  # 写入语句 -> {key: 行}，见 Record
+        self.dimensions = Dimensions()
+        self.thread = None
+        self.written = 0  # 已提交写入的行数
+        self.inserted = 0  # 实际新增的行数（不含重复）
+        self.updated = 0  # upsert模式下有字段变化的行数
+        self.lost_units = set()  # 有数据写入失败的专业和学校单元，见 _mark_lost
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+            self.thread.start()
+
+    def _check_alive(self):
+        # 写入线程意外退出后再等待队列只会永远挂起，直接报错
+        if self.thread is not None and not self.thread.is_alive():
+            raise RuntimeError('数据库写入线程已退出，数据无法写入')
+
+    def put(self, item):
+        self.start()
+        while True:
+            self._check_alive()
+            try:
+                self.queue.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    async def put_async(self, item):
+        self.start()
+        self._check_alive()
         try:
-            session.add(major)
-            session.commit()
-            print(f"成功插入：{item.get('zymc')}-{item.get('yjfxmc')} 科目组合: {exam_subjects}")
-        except IntegrityError:
-            session.rollback()
-            print(f"记录已存在，插入被忽略：{item.get('zymc')}-{item.get('yjfxmc')} 科目组合: {exam_subjects}")
+            self.queue.put_nowait(item)
+        except queue.Full:
+            # 写入跟不上抓取速度，在线程池里等待队列腾出空间，不阻塞事件循环
+            started = time.monotonic()
+            await asyncio.to_thread(self.put, item)
+            metrics.inc('yzw_db_backpressure_seconds_total', time.monotonic() - started)
+
+    def flush(self):
+        """
+        等待队列中已有的数据全部写入数据库
+        """
+        if self.thread is None:
+            return
+        self.put(_FLUSH)
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                self._check_alive()
+                self.queue.all_tasks_done.wait(1)
+
+    def close(self):
+        if self.thread is None:
+            return
+        try:
+            self.put(_STOP)
+        except RuntimeError as e:
+            logger.error(f"{e}，队列中还有{self.queue.qsize()}条未写入")
+        self.thread.join()
+        self.thread = None
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while True:
+            timeout = max(0, self.flush_interval - (time.monotonic() - last_flush))
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None  # 距上次写入已超过 flush_interval
+            try:
+                if item is None or item is _FLUSH:
+                    self._write()
+                    last_flush = time.monotonic()
+                    continue
+                if item is _STOP:
+                    self._write()
+                    return
+                if isinstance(item, Record):
+                    self.records.setdefault(item.statement, {})[item.key] = item.row
+                else:
+                    self.rows.extend(build_rows(item))
+                if len(self.rows) + sum(len(rows) for rows in self.records.values()) >= self.batch_size:
+                    self._write()
+                    last_flush = time.monotonic()
+            except Exception as e:
+                logger.error(f"写入线程处理数据失败：{e}")
+            finally:
+                if item is not None:
+                    self.queue.task_done()
+
+    def _mark_lost(self, records):
+        """
+        有数据写入失败的单元不能记为done，改记为failed，续爬时重新抓取；学校的专业列表指纹也不保存。
+        数据中没有省份代码，出现写入失败后结束的省份一律记为failed（续爬时已完成的学校仍会跳过）
+        """
+        if not self.lost_units:
+            return
+        states = records.get(upsert_states, {})
+        for key, row in states.items():
+            if row['status'] == 'done' and (key in self.lost_units or row['unit_type'] == 'province'):
+                states[key] = dict(row, status='failed')
+        fingerprints = records.get(upsert_fingerprints, {})
+        for school_code in list(fingerprints):
+            if ('school', str(school_code)) in self.lost_units:
+                del fingerprints[school_code]
+
+    def _write(self):
+        rows, self.rows = self.rows, []
+        records, self.records = self.records, {}
+        if not rows and not records:
+            return
+        self._mark_lost(records)
+        try:
+            started = time.monotonic()
+            try:
+                written, inserted, updated = self._write_batch(rows, records)
+            except DimensionError as e:
+                # 其他进程同时插入了相同的维度数据，在新的事务中重试整批
+                logger.info(f"维度数据查询不完整，重试本批写入：{e}")
+                written, inserted, updated = self._write_batch(rows, records)
+            metrics.observe('yzw_db_write_seconds', time.monotonic() - started)
+            if rows:
+                self.written += written
+                self.inserted += inserted
+                self.updated += updated
+                metrics.inc('yzw_db_rows_total', inserted, result='inserted')
+                metrics.inc('yzw_db_rows_total', updated, result='updated')
+                metrics.inc('yzw_db_rows_total', written - inserted - updated, result='unchanged')
+                if self.write_mode == 'upsert':
+                    logger.debug(f"批量写入{written}条：新增{inserted}条，更新{updated}条")
+                else:
+                    logger.debug(f"批量写入{len(rows)}条：新增{inserted}条，重复忽略{len(rows) - inserted}条")
         except SQLAlchemyError as e:
-            session.rollback()
-            print(f"插入失败：{e}")
-    session.close()
+            # 整批失败时逐条写入，避免一条坏数据拖累整批
+            logger.warning(f"批量写入失败，改为逐条写入：{e}")
+            for row in rows:
+                try:
+                    with self._transaction() as conn:
+                        _, inserted, updated = self._insert(conn, [row])
+                    self.written += 1
+                    self.inserted += inserted
+                    self.updated += updated
+                    metrics.inc('yzw_db_rows_total', result='inserted' if inserted else 'updated' if updated else 'unchanged')
+                except SQLAlchemyError as e:
+                    logger.error(f"插入失败：{row.get('major_name')}-{row.get('research_direction')}：{e}")
+                    self.lost_units.update(row_units(row))
+            self._mark_lost(records)
+            for statement, batch in records.items():
+                try:
+                    with engine.begin() as conn:
+                        conn.execute(statement(list(batch.values())))
+                except SQLAlchemyError as e:
+                    logger.error(f"写入{statement.__name__}失败：{e}")
+
+    def _write_batch(self, rows, records):
+        """
+        数据和抓取状态等记录在同一个事务中写入，返回 (写入行数, 新增行数, 更新行数)
+        """
+        written = inserted = updated = 0
+        with self._transaction() as conn:
+            if rows:
+                written, inserted, updated = self._insert(conn, rows)
+            for statement, batch in records.items():
+                conn.execute(statement(list(batch.values())))
+        return written, inserted, updated
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        try:
+            with engine.begin() as conn:
+                yield conn
+        except BaseException:
+            self.dimensions.rollback()
+            raise
+        self.dimensions.commit()
+
+    def _insert(self, conn, rows):
+        """
+        写入一批 major 数据，返回 (写入行数, 新增行数, 更新行数)：
+        upsert 模式下同一批中重复的数据只写入一次，ignore 模式下重复的数据计入写入行数、由唯一索引忽略
+        """
+        rows = self.dimensions.resolve(conn, rows)
+        if self.write_mode == 'upsert':
+            return upsert_majors(conn, rows)
+        return len(rows), conn.execute(insert_ignore(rows)).rowcount, 0
+
+
+writer = BatchWriter(
+    batch_size=database.get('batch_size', 500),
+    flush_interval=database.get('flush_interval', 10),
+    queue_size=database.get('queue_size', 5000),
+    write_mode=database.get('write_mode', 'ignore'),
+)
+# 程序退出（包括 sys.exit）前把队列和缓冲区里的数据写完
+atexit.register(writer.close)
+metrics.add_collector(lambda: [('yzw_db_queue_size', {}, writer.queue.qsize())])
+
+
+def insert(item):
+    """
+    插入 Major 实体数据（交给后台写入线程批量写入）
+    """
+    writer.put(item)
+
+
+async def insert_async(item):
+    """
+    协程中使用的插入接口，写入线程落后太多时会挂起等待
+    """
+    await writer.put_async(item)
+
+
+async def save_state_async(unit_type, unit_key, status):
+    """
+    记录抓取单元的状态（done/failed），在此之前提交的数据会先于状态写入
+    """
+    await writer.put_async(UnitState(unit_type, unit_key, status))
+
+
+async def save_fingerprint_async(row, changes):
+    """
+    记录学校专业列表的指纹和本次发现的变化，写在该学校专业数据之后
+    """
+    for change in changes:
+        await writer.put_async(ListChange(change))
+    await writer.put_async(Fingerprint(row))
+
+
+def flush():
+    """
+    等待已提交的数据全部写入数据库
+    """
+    writer.flush()
+
+
+def close():
+    """
+    写完剩余数据并停止写入线程
+    """
+    writer.close()
+
 
 def get_last_major():
     """
@@ -70,17 +593,60 @@ def get_last_major():
     """
     session = Session()
     try:
-        last_major = session.query(Major).order_by(Major.id.desc()).first()
+        last_major = (
+            session.query(Major.major_code, School.name, School.province)
+            .outerjoin(School, Major.school_id == School.id)
+            .order_by(Major.id.desc())
+            .first()
+        )
         if last_major:
             return {
                 'province': last_major.province,
-                'school_name': last_major.school_name,
+                'school_name': last_major.name,
                 'major_code': last_major.major_code
             }
         else:
             return None
     except SQLAlchemyError as e:
-        print(f"查询最后一条 major 记录失败：{e}")
+        logger.error(f"查询最后一条 major 记录失败：{e}")
         return None
     finally:
         session.close()
+
+
+def load_done_units():
+    """
+    读取已完成的抓取单元，返回 {(unit_type, unit_key), ...}
+    """
+    session = Session()
+    try:
+        rows = session.query(CrawlState.unit_type, CrawlState.unit_key).filter(CrawlState.status == 'done').all()
+        return {(unit_type, unit_key) for unit_type, unit_key in rows}
+    except SQLAlchemyError as e:
+        logger.error(f"读取抓取状态失败：{e}")
+        return set()
+    finally:
+        session.close()
+
+
+def reset_crawl_state():
+    """
+    清空抓取状态，下次运行会重新爬取全部单元
+    """
+    with engine.begin() as conn:
+        conn.execute(CrawlState.__table__.delete())
+
+
+def load_fingerprints():
+    """
+    读取各学校专业列表的指纹，返回 {school_code: {'digest': ..., 'majors': {专业key: 哈希}}}
+    """
+    session = Session()
+    try:
+        rows = session.query(SchoolFingerprint.school_code, SchoolFingerprint.digest, SchoolFingerprint.majors).all()
+        return {code: {'digest': digest, 'majors': json.loads(majors or '{}')} for code, digest, majors in rows}
+    except SQLAlchemyError as e:
+        logger.error(f"读取专业列表指纹失败：{e}")
+        return {}
+    finally:
+        session.close()
@@ -1,26 +1,98 @@
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import BINARY, Column, DateTime, ForeignKey, Integer, String, Text, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
 
+class School(Base):
+    __tablename__ = 'school'
+
+    id = Column(Integer, primary_key=True, autoincrement=True, comment='主键')
+    name = Column(String(100), nullable=False, unique=True, comment='学校名称')
+    code = Column(String(20), nullable=True, comment='学校代码')
+    province = Column(String(100), nullable=True, comment='所在省份')
+
+
+class Department(Base):
+    __tablename__ = 'department'
+
+    id = Column(Integer, primary_key=True, autoincrement=True, comment='主键')
+    school_id = Column(Integer, ForeignKey('school.id'), nullable=False, comment='学校')
+    name = Column(String(100), nullable=False, comment='院系所名称')
+
+    __table_args__ = (UniqueConstraint('school_id', 'name', name='school_department'),)
+
+
+class Subject(Base):
+    __tablename__ = 'subject'
+
+    id = Column(Integer, primary_key=True, autoincrement=True, comment='主键')
+    name = Column(String(100), nullable=False, unique=True, comment='考试科目名称')
+
+
 class Major(Base):
     __tablename__ = 'major'
 
     id = Column(Integer, primary_key=True, autoincrement=True, comment='主键')
-    school_name = Column(String(255), nullable=True, comment='学校名称')
+    school_id = Column(Integer, ForeignKey('school.id'), nullable=True, comment='学校')
     major_name = Column(String(255), nullable=True, comment='专业名称')
-    province = Column(String(255), nullable=True, comment='所在省份')
     major_code = Column(String(255), nullable=True, comment='专业代码')
     degree_type = Column(String(255), nullable=True, comment='学位类型')
     exam_type = Column(String(255), nullable=True, comment='考试方式')
-    department = Column(String(255), nullable=True, comment='院系所')
+    department_id = Column(Integer, ForeignKey('department.id'), nullable=True, comment='院系所')
     study_mode = Column(String(255), nullable=True, comment='学习方式')
     research_direction = Column(String(255), nullable=True, comment='研究方向')
     veteran_program = Column(String(255), nullable=True, comment='退役计划')
     shaogu_program = Column(String(255), nullable=True, comment='少骨计划')
     advisor = Column(String(255), nullable=True, comment='指导教师')
     planned_enrollment = Column(String(255), nullable=True, comment='拟招生人数')
-    exam_subject1 = Column(String(255), nullable=True, comment='考试科目1')
-    exam_subject2 = Column(String(255), nullable=True, comment='考试科目2')
-    exam_subject3 = Column(String(255), nullable=True, comment='考试科目3')
-    exam_subject4 = Column(String(255), nullable=True, comment='考试科目4')
+    exam_subject1_id = Column(Integer, ForeignKey('subject.id'), nullable=True, comment='考试科目1')
+    exam_subject2_id = Column(Integer, ForeignKey('subject.id'), nullable=True, comment='考试科目2')
+    exam_subject3_id = Column(Integer, ForeignKey('subject.id'), nullable=True, comment='考试科目3')
+    exam_subject4_id = Column(Integer, ForeignKey('subject.id'), nullable=True, comment='考试科目4')
+    content_hash = Column(BINARY(16), nullable=False, unique=True, comment='身份字段的MD5，唯一索引')
+
+
+class CrawlState(Base):
+    __tablename__ = 'crawl_state'
+
+    id = Column(Integer, primary_key=True, autoincrement=True, comment='主键')
+    unit_type = Column(String(20), nullable=False, comment='单元类型：province/school/major')
+    unit_key = Column(String(255), nullable=False, comment='单元标识')
+    status = Column(String(20), nullable=False, comment='状态：done/failed')
+    updated_at = Column(DateTime, nullable=False, comment='更新时间')
+
+    __table_args__ = (UniqueConstraint('unit_type', 'unit_key', name='unit'),)
+
+
+class SchoolFingerprint(Base):
+    __tablename__ = 'school_fingerprint'
+
+    id = Column(Integer, primary_key=True, autoincrement=True, comment='主键')
+    school_code = Column(String(20), nullable=False, unique=True, comment='学校代码')
+    school_name = Column(String(255), nullable=True, comment='学校名称')
+    total_count = Column(Integer, nullable=True, comment='专业列表总数')
+    digest = Column(String(40), nullable=False, comment='专业列表指纹')
+    majors = Column(Text, nullable=True, comment='各专业的哈希（JSON）')
+    updated_at = Column(DateTime, nullable=False, comment='更新时间')
+
+
+class MajorListChange(Base):
+    __tablename__ = 'major_list_change'
+
+    id = Column(Integer, primary_key=True, autoincrement=True, comment='主键')
+    school_code = Column(String(20), nullable=False, comment='学校代码')
+    school_name = Column(String(255), nullable=True, comment='学校名称')
+    major_key = Column(String(255), nullable=False, comment='专业代码:专业名称')
+    change_type = Column(String(10), nullable=False, comment='变化类型：insert/update/delete')
+    crawled_at = Column(DateTime, nullable=False, comment='发现变化的爬取时间')
+
+
+class MajorChange(Base):
+    __tablename__ = 'major_change'
+
+    id = Column(Integer, primary_key=True, autoincrement=True, comment='主键')
+    major_id = Column(Integer, nullable=False, comment='major表主键')
+    column_name = Column(String(50), nullable=False, comment='变化的字段')
+    old_value = Column(String(500), nullable=True, comment='旧值')
+    new_value = Column(String(500), nullable=True, comment='新值')
+    crawled_at = Column(DateTime, nullable=False, comment='爬取时间')
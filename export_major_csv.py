@@ -1,41 +1,144 @@
+import argparse
 import csv
-from sqlalchemy.orm import sessionmaker
-from data.db import engine
-from data.entity import Major
+from data.db import engine, major_view
 
 # ====== 你可以在这里自定义导出文件名 ======
 EXPORT_FILENAME = 'majors.csv'  # 改成你想要的文件名
 # =========================================
 
-BATCH_SIZE = 1000
+BATCH_SIZE = 5000  # 每次从数据库游标取出的行数
+BUFFER_SIZE = 1024 * 1024  # 文件写入缓冲区大小
+# 取值较少的文本列在 parquet/arrow 中使用字典编码，研究方向、指导教师等几乎不重复的列保持普通字符串
+DICTIONARY_COLUMNS = {
+    'school_name', 'major_name', 'province', 'major_code', 'degree_type', 'exam_type', 'department', 'study_mode',
+    'veteran_program', 'shaogu_program', 'exam_subject1', 'exam_subject2', 'exam_subject3', 'exam_subject4',
+}
 
-def export_major_to_csv():
+
+def build_query(provinces=None, major_code_prefix=None, degree_types=None):
     """
-    导出major表所有字段为csv，支持自定义文件名，分批写入避免内存爆炸。
+    导出查询：学校、院系所、考试科目从维度表连接回来，导出的列与原来一致，可按省份、专业代码前缀、学位类型筛选
     """
-    Session = sessionmaker(bind=engine)
-    session = Session()
-    offset = 0
-    fields = [c.name for c in Major.__table__.columns]
+    query = major_view()
+    columns = query.selected_columns
+    if provinces:
+        query = query.where(columns.province.in_(provinces))
+    if major_code_prefix:
+        query = query.where(columns.major_code.like(f'{major_code_prefix}%'))
+    if degree_types:
+        query = query.where(columns.degree_type.in_(degree_types))
+    return query.order_by(columns.province, columns.school_name, columns.id)
+
 
-    with open(EXPORT_FILENAME, 'w', newline='', encoding='utf-8-sig') as f:
+def stream_rows(conn, query):
+    """
+    只执行一次查询，用服务端游标流式读取，每次返回 BATCH_SIZE 行，内存占用与数据量无关
+    """
+    result = conn.execution_options(stream_results=True, yield_per=BATCH_SIZE).execute(query)
+    return result.partitions()
+
+
+def export_major_to_csv(filename=EXPORT_FILENAME, query=None):
+    """
+    导出major表所有字段为csv，支持自定义文件名。
+    """
+    query = query if query is not None else build_query()
+    fields = [c.name for c in query.selected_columns]
+
+    count = 0
+    with engine.connect() as conn, \
+            open(filename, 'w', newline='', encoding='utf-8-sig', buffering=BUFFER_SIZE) as f:
         writer = csv.writer(f)
         writer.writerow(fields)  # 写表头
-        while True:
-            rows = (
-                session.query(Major)
-                .order_by(Major.province, Major.school_name)
-                .offset(offset)
-                .limit(BATCH_SIZE)
-                .all()
-            )
-            if not rows:
-                break
-            for row in rows:
-                writer.writerow([getattr(row, field) for field in fields])
-            offset += BATCH_SIZE
-    session.close()
-    print(f"导出完成，文件名：{EXPORT_FILENAME}")
+        for rows in stream_rows(conn, query):
+            writer.writerows(rows)
+            count += len(rows)
+    print(f"导出完成，共{count}行，文件名：{filename}")
+
+
+class DictionaryEncoder:
+    """
+    在整个导出过程中维护同一份字典，字典只追加不修改，
+    arrow 文件中后面的批次只需要写入新增的字典项
+    """
+
+    def __init__(self):
+        self.values = []
+        self.index = {}
+
+    def encode(self, pa, column):
+        indices = []
+        for value in column:
+            if value is None:
+                indices.append(None)
+                continue
+            i = self.index.get(value)
+            if i is None:
+                i = self.index[value] = len(self.values)
+                self.values.append(value)
+            indices.append(i)
+        return pa.DictionaryArray.from_arrays(pa.array(indices, pa.int32()), pa.array(self.values, pa.string()))
+
+
+def export_major_to_arrow(filename, fmt='parquet', query=None):
+    """
+    导出为 parquet 或 arrow（IPC文件）格式，文本列使用字典编码，按批写入
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        print("导出 parquet/arrow 格式需要先安装 pyarrow：pip install pyarrow")
+        return
+
+    query = query if query is not None else build_query()
+    fields = [c.name for c in query.selected_columns]
+    schema = pa.schema([
+        (field, pa.int64() if field == 'id' else
+         pa.dictionary(pa.int32(), pa.string()) if field in DICTIONARY_COLUMNS else pa.string())
+        for field in fields
+    ])
+    encoders = {field: DictionaryEncoder() for field in fields if field in DICTIONARY_COLUMNS}
+
+    if fmt == 'parquet':
+        writer = pq.ParquetWriter(filename, schema, compression='zstd')
+    else:
+        writer = pa.ipc.new_file(filename, schema, options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True))
+
+    count = 0
+    try:
+        with engine.connect() as conn:
+            for rows in stream_rows(conn, query):
+                columns = list(zip(*rows))
+                arrays = [
+                    encoders[field].encode(pa, column) if field in encoders else pa.array(column, schema.field(field).type)
+                    for field, column in zip(fields, columns)
+                ]
+                writer.write_batch(pa.record_batch(arrays, schema=schema))
+                count += len(rows)
+    finally:
+        writer.close()
+    print(f"导出完成，共{count}行，文件名：{filename}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='导出major表数据')
+    parser.add_argument('--format', choices=['csv', 'parquet', 'arrow'], default='csv', help='导出格式，默认csv')
+    parser.add_argument('--output', help=f'导出文件名，默认 {EXPORT_FILENAME} 或 majors.parquet / majors.arrow')
+    parser.add_argument('--province', help='只导出这些省份，多个用逗号分隔，如 北京,上海')
+    parser.add_argument('--major-code-prefix', help='只导出专业代码以此开头的数据，如 0812')
+    parser.add_argument('--degree-type', help='只导出这些学位类型，多个用逗号分隔')
+    return parser.parse_args()
+
 
 if __name__ == '__main__':
-    export_major_to_csv() 
\ No newline at end of file
+    args = parse_args()
+    query = build_query(
+        provinces=args.province.split(',') if args.province else None,
+        major_code_prefix=args.major_code_prefix,
+        degree_types=args.degree_type.split(',') if args.degree_type else None,
+    )
+    if args.format == 'csv':
+        export_major_to_csv(args.output or EXPORT_FILENAME, query)
+    else:
+        export_major_to_arrow(args.output or f'majors.{args.format}', args.format, query)
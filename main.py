@@ -1,14 +1,28 @@
+import argparse
 import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import time
 
 import aiohttp
 
 from crawler.login import Login
-from crawler.crawler import Crawler
+from crawler.crawler import Crawler, DW_URL
+from crawler.checkpoint import Checkpoint
+from crawler.cache import response_cache
+from crawler.delta import DeltaTracker
+from crawler.metrics import MetricsExporter, metrics
+from crawler.trace import tracer
+from crawler.logs import ProgressReporter, setup_logging, stop_logging
 from data import db  # 新增导入
 from crawler.crawler import retry_failed_requests
 from proxy_manager import ProxyManager
 from config import config
 
+logger = logging.getLogger('yzw.main')
+
 ssList = [
         {
             'code': '1',
@@ -57,140 +71,487 @@ ssList = [
         }
     ]
 
-async def work():
-    session = await Login().do_login()
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='爬取研招网专业信息。所有参数也可以通过环境变量或 config.yaml 的 run 部分提供，缺少的参数会在运行时询问')
+    parser.add_argument('--login', choices=['password', 'cookie'], help='登录方式（环境变量 YZW_LOGIN）')
+    parser.add_argument('--username', help='账号（环境变量 YZW_USERNAME）')
+    parser.add_argument('--password', help='密码（环境变量 YZW_PASSWORD）')
+    parser.add_argument('--cookie', help='cookie字符串（环境变量 YZW_COOKIE）')
+    parser.add_argument('--network', choices=['proxy', 'direct'], help='网络连接方式：代理池/自身IP（环境变量 YZW_NETWORK）')
+    parser.add_argument('--breakpoint', choices=['db', 'manual', 'checkpoint', 'none'],
+                        help='断点模式：数据库最后一条记录/手动指定/按抓取状态跳过已完成的单元/从头开始（环境变量 YZW_BREAKPOINT）')
+    parser.add_argument('--reset-checkpoint', action='store_true', help='运行前清空抓取状态表 crawl_state')
+    parser.add_argument('--refresh-cache', action='store_true', help='运行前清空学校列表、专业列表的本地响应缓存')
+    parser.add_argument('--delta', action='store_true',
+                        help='增量模式：只抓取专业列表有变化的学校中新增和变化的专业（环境变量 YZW_DELTA）')
+    parser.add_argument('--bp-province', help='手动断点：省份名称')
+    parser.add_argument('--bp-school', help='手动断点：学校名称（可选）')
+    parser.add_argument('--bp-major', help='手动断点：专业代码（可选）')
+    parser.add_argument('--provinces',
+                        help='只爬取这些省份，省份代码或名称用逗号分隔，如 11,12 或 北京,天津（环境变量 YZW_PROVINCES）')
+    parser.add_argument('--shards', type=int,
+                        help='多进程模式：把省份分给多少个进程同时爬取，每个进程单独登录、单独使用代理和数据库写入（环境变量 YZW_SHARDS）')
+    return parser.parse_args()
+
+
+def get_option(args, name, env=None):
+    """
+    按 命令行参数 -> 环境变量 -> config.yaml 的 run 部分 的顺序取值，都没有时返回None
+    """
+    value = getattr(args, name, None)
+    if not value and env:
+        value = os.environ.get(env)
+    if not value:
+        value = config.get(f'run.{name}')
+    return value or None
+
+
+def select_provinces(selected):
+    """
+    按省份代码或名称筛选 ssList 中的省份，selected 为空时返回全部省份
+    """
+    provinces = [child for ss in ssList for child in ss['children']]
+    if not selected:
+        return provinces
+    if isinstance(selected, str):
+        selected = selected.split(',')
+    selected = {str(x).strip() for x in selected if str(x).strip()}
+    unknown = selected - {p['code'] for p in provinces} - {p['name'] for p in provinces}
+    if unknown:
+        raise ValueError(f"未知的省份：{', '.join(sorted(unknown))}")
+    return [p for p in provinces if p['code'] in selected or p['name'] in selected]
 
-    # 需要get访问同步登录状态
-    await session.get('https://yz.chsi.com.cn/zsml/a/dw.do')
 
-    # 代理功能选择
+def ask_choice(prompt, choices=('1', '2')):
+    while True:
+        choice = input(prompt).strip()
+        if choice in choices:
+            return choice
+        print(f"请输入{'或'.join(choices)}")
+
+
+def resolve_network(args):
+    """
+    网络连接方式：'proxy' 或 'direct'
+    """
+    network = get_option(args, 'network', 'YZW_NETWORK')
+    if network:
+        return network
     print("\n请选择网络连接方式：(如果你不知道什么是代理池就输入2)")
     print("1. 使用代理池（推荐，可有效避免IP被封）")
     print("2. 使用自身IP（如果代理池不可用或不想使用代理）")
-    
-    while True:
-        try:
-            proxy_choice = input("请选择网络连接方式（输入1或2）：").strip()
-            if proxy_choice in ['1', '2']:
-                break
-            else:
-                print("请输入1或2")
-        except KeyboardInterrupt:
-            print("\n程序被用户中断")
-            return
-
-    # 初始化代理管理器
-    proxy_manager = None
-    
-    if proxy_choice == '1':
-        print("正在初始化代理管理器...")
-        # 检查是否启用代理功能
-        if config.get('proxy.enabled', False):
-            proxy_pool_url = config.get('proxy.pool_url', 'http://127.0.0.1:5010')
-            proxy_manager = ProxyManager(proxy_pool_url)
-            try:
-                # 尝试初始化代理（可选，如果代理池不可用会降级到自身IP）
-                await proxy_manager.initialize_proxy()
-                print("代理管理器初始化成功")
-            except Exception as e:
-                print(f"代理初始化失败，将使用自身IP: {e}")
-                proxy_manager = None
-        else:
-            print("代理功能未启用，将使用自身IP")
-    else:
-        print("已选择使用自身IP")
+    return 'proxy' if ask_choice("请选择网络连接方式（输入1或2）：") == '1' else 'direct'
+
 
-    # 断点选择
+def resolve_breakpoint_mode(args):
+    """
+    断点模式：'db'、'manual'、'checkpoint' 或 'none'
+    """
+    mode = get_option(args, 'breakpoint', 'YZW_BREAKPOINT')
+    if mode:
+        return mode
     print("\n请选择断点模式：（数据抓取的起始点）")
     print("1. 从数据库获取最后一条记录作为断点")
     print("2. 手动输入断点参数")
-    
-    while True:
-        try:
-            choice = input("请选择模式（输入1或2）：").strip()
-            if choice in ['1', '2']:
-                break
-            else:
-                print("请输入1或2")
-        except KeyboardInterrupt:
-            print("\n程序被用户中断")
-            return
-    
-    # 获取断点信息
-    if choice == '1':
+    print("3. 按抓取状态续爬（跳过已完成的省份、学校和专业）")
+    choice = ask_choice("请选择模式（输入1、2或3）：", ('1', '2', '3'))
+    return {'1': 'db', '2': 'manual', '3': 'checkpoint'}[choice]
+
+
+def resolve_breakpoint(args, mode):
+    """
+    按断点模式得到断点数据，返回None表示从头开始；断点参数不合法时抛出ValueError
+    """
+    if mode == 'none':
+        logger.info("不使用断点，将从第一个省份开始爬取")
+        return None
+
+    if mode == 'checkpoint':
+        logger.info("按抓取状态续爬，已完成的单元会被跳过")
+        return None
+
+    if mode == 'db':
         # 模式1：从数据库获取最后一条记录
         last_major = db.get_last_major()
-        last_province = last_major['province'] if last_major else None
-        reached_province = False if last_province else True
-        print(f"断点信息：last_province={last_province}, reached_province={reached_province}")
         if last_major:
-            print(f"完整断点数据：{last_major}")
+            logger.info(f"完整断点数据：{last_major}")
         else:
-            print("没有找到断点数据，将从第一个省份开始爬取")
-    else:
-        # 模式2：手动输入断点参数
+            logger.info("没有找到断点数据，将从第一个省份开始爬取")
+        return last_major
+
+    # 模式2：手动输入断点参数
+    province_name = get_option(args, 'bp_province')
+    school_name = get_option(args, 'bp_school')
+    major_code = get_option(args, 'bp_major')
+    if not province_name:
         print("\n请输入断点参数：")
-        try:
-            province_name = input("省份名称（如：上海、内蒙等）：").strip()
-            school_name = input("学校名称（可选，直接回车跳过）：").strip() or None
-            major_code = input("专业代码（可选，直接回车跳过）：").strip() or None
-            
-            # 验证省份名称是否在列表中
-            valid_provinces = []
-            for ss in ssList:
-                for child in ss['children']:
-                    valid_provinces.append(child['name'])
-            
-            if province_name not in valid_provinces:
-                print(f"错误：省份名称 '{province_name}' 不在有效列表中")
-                print(f"有效省份：{', '.join(valid_provinces)}")
-                return
-            
-            last_major = {
-                'province': province_name,
-                'school_name': school_name,
-                'major_code': major_code
-            }
-            last_province = province_name
-            reached_province = False
-            print(f"断点信息：last_province={last_province}, reached_province={reached_province}")
-            print(f"完整断点数据：{last_major}")
-            
-        except KeyboardInterrupt:
-            print("\n程序被用户中断")
-            return
-        except Exception as e:
-            print(f"输入断点参数时出错：{e}")
-            return
+        province_name = input("省份名称（如：上海、内蒙等）：").strip()
+        school_name = input("学校名称（可选，直接回车跳过）：").strip() or None
+        major_code = input("专业代码（可选，直接回车跳过）：").strip() or None
+
+    # 验证省份名称是否在列表中
+    valid_provinces = []
+    for ss in ssList:
+        for child in ss['children']:
+            valid_provinces.append(child['name'])
+
+    if province_name not in valid_provinces:
+        raise ValueError(f"省份名称 '{province_name}' 不在有效列表中\n有效省份：{', '.join(valid_provinces)}")
+
+    last_major = {
+        'province': province_name,
+        'school_name': school_name,
+        'major_code': major_code
+    }
+    logger.info(f"完整断点数据：{last_major}")
+    return last_major
+
+
+def pending_provinces(provinces, last_major):
+    """
+    去掉断点省份之前的省份，返回 (待爬取省份, 断点数据)
+    断点省份不在本次爬取范围内时（例如按省份分片运行），从第一个省份开始
+    """
+    last_province = last_major['province'] if last_major else None
+    names = [p['name'] for p in provinces]
+    if not last_province:
+        return provinces, last_major
+    if last_province not in names:
+        logger.info(f"断点省份{last_province}不在本次爬取范围内，从第一个省份开始爬取")
+        return provinces, None
+    index = names.index(last_province)
+    for province in provinces[:index]:
+        logger.info(f"跳过省份：{province['name']}（未到断点）")
+    logger.info(f"到达断点省份：{last_province}")
+    return provinces[index:], last_major
+
+
+def create_checkpoint(mode):
+    """
+    抓取进度：启用时记录到 crawl_state 表，checkpoint 断点模式下先读取已完成的单元
+    """
+    if not config.get('checkpoint.enabled', True):
+        return Checkpoint(persist=False)
+    if mode == 'checkpoint':
+        return Checkpoint.load()
+    return Checkpoint()
+
+
+def use_delta(args):
+    return str(get_option(args, 'delta', 'YZW_DELTA')).lower() in ('1', 'true', 'yes')
+
+
+def create_delta(enabled):
+    """
+    增量模式下读取上次的专业列表指纹，全量模式返回None
+    """
+    return DeltaTracker.load() if enabled else None
+
+
+def log_delta(delta):
+    if delta:
+        logger.info(f"增量模式：{delta.unchanged}个学校专业列表没有变化，{delta.changed}个学校有变化或首次记录")
+
+
+async def start_metrics(shard=None):
+    """
+    启用指标输出时启动 /metrics 服务和定时快照，未启用时返回None
+    """
+    if not config.get('metrics.enabled', False):
+        return None
+    exporter = MetricsExporter.from_config(metrics, shard)
+    await exporter.start()
+    return exporter
+
+
+def log_time_breakdown():
+    breakdown = metrics.time_breakdown()
+    logger.info(f"累计耗时：限速等待{breakdown['rate_limiter_wait']:.1f}秒，网络请求{breakdown['network']:.1f}秒，"
+                f"数据库写入{breakdown['db_write']:.1f}秒，写入队列已满等待{breakdown['db_backpressure']:.1f}秒")
+
+
+def log_trace():
+    if tracer.enabled:
+        tracer.close()
+        logger.info(f"请求跟踪：共记录{tracer.count}个请求，保存在{tracer.path}，用 python trace_summary.py {tracer.path} 查看汇总")
+
+
+async def create_proxy_manager(network):
+    if network != 'proxy':
+        logger.info("已选择使用自身IP")
+        return None
+
+    logger.info("正在初始化代理管理器...")
+    # 检查是否启用代理功能
+    if not config.get('proxy.enabled', False):
+        logger.info("代理功能未启用，将使用自身IP")
+        return None
+
+    proxy_pool_url = config.get('proxy.pool_url', 'http://127.0.0.1:5010')
+    proxy_manager = ProxyManager(proxy_pool_url)
+    try:
+        # 尝试初始化代理（可选，如果代理池不可用会降级到自身IP）
+        if await proxy_manager.initialize_proxy():
+            logger.info(f"代理管理器初始化成功，可用代理{len(proxy_manager.proxies)}个")
+        else:
+            logger.warning("暂无可用代理，先使用自身IP，后台会继续补充代理")
+    except Exception as e:
+        logger.warning(f"代理初始化失败，将使用自身IP: {e}")
+        await proxy_manager.close()
+        proxy_manager = None
+    return proxy_manager
+
+
+async def login(credentials):
+    session = await Login().do_login(**credentials)
+    # 需要get访问同步登录状态
+    await session.get(DW_URL)
+    return session
+
+
+async def crawl_province(crawler, province):
+    logger.info(f"正在爬取{province['name']}的学校信息...")
+    if config.get('concurrency.enabled', False):
+        await crawler.run([province])
+    elif crawler.open_province(province['code']):
+        await crawler.fetch_school_info(province['code'])
+    else:
+        logger.info(f"{province['name']}已全部完成，跳过")
+        return
+    logger.info(f"{province['name']}的学校信息爬取完成！")
+
+
+async def work(args):
+    try:
+        provinces = select_provinces(get_option(args, 'provinces', 'YZW_PROVINCES'))
+    except ValueError as e:
+        logger.error(f"错误：{e}")
+        return
+
+    credentials = {
+        'method': get_option(args, 'login', 'YZW_LOGIN'),
+        'username': get_option(args, 'username', 'YZW_USERNAME'),
+        'password': get_option(args, 'password', 'YZW_PASSWORD'),
+        'cookie': get_option(args, 'cookie', 'YZW_COOKIE'),
+    }
+    if args.reset_checkpoint:
+        db.reset_crawl_state()
+        logger.info("已清空抓取状态")
+    if args.refresh_cache:
+        response_cache.clear()
+        logger.info("已清空响应缓存")
+    session = await login(credentials)
+    exporter = await start_metrics()
+
+    try:
+        # 代理功能选择
+        proxy_manager = await create_proxy_manager(resolve_network(args))
+        # 断点选择
+        mode = resolve_breakpoint_mode(args)
+        last_major = resolve_breakpoint(args, mode)
+    except KeyboardInterrupt:
+        logger.warning("程序被用户中断")
+        await session.close()
+        if exporter:
+            await exporter.close()
+        return
+    except ValueError as e:
+        logger.error(f"错误：{e}")
+        await session.close()
+        if exporter:
+            await exporter.close()
+        return
+    pending, last_major = pending_provinces(provinces, last_major)
 
     # 获取爬虫实例
-    crawler = Crawler(session, breakpoint=last_major, proxy_manager=proxy_manager)
+    crawler = Crawler(session, breakpoint=last_major, proxy_manager=proxy_manager, checkpoint=create_checkpoint(mode),
+                      delta=create_delta(use_delta(args)))
+    crawler.province_names = {p['code']: p['name'] for p in provinces}
+    progress = ProgressReporter(crawler, db.writer, config.get('logging.progress_interval', 30))
+    progress.start()
 
     # 1. 先用断点crawler补抓日志失败项
-    print("开始执行日志重试...")
+    logger.info("开始执行日志重试...")
     await retry_failed_requests(crawler)
-    print("日志重试执行完毕，开始正常爬取流程...")
+    logger.info("日志重试执行完毕，开始正常爬取流程...")
 
-    # 2. 再顺序爬取
-    print("开始遍历省份列表...")
-    for ss in ssList:
-        print(f"处理区域：{ss['name']}")
-        for child in ss['children']:
-            province_name = child['name']
-            # 断点判断：未到断点省份则跳过
-            if not reached_province:
-                if province_name == last_province:
-                    reached_province = True
-                    print(f"到达断点省份：{province_name}")
-                else:
-                    print(f"跳过省份：{province_name}（未到断点）")
-                    continue
-            print(f"正在爬取{province_name}的学校信息...")
-            await crawler.fetch_school_info(child['code'])
-            print(f"{province_name}的学校信息爬取完成！")
-
-    print("所有省份爬取完成！")
+    if config.get('concurrency.enabled', False):
+        # 2. 并发模式：把断点之后的省份一次性交给任务队列
+        logger.info(f"并发模式：共{len(pending)}个省份，worker数量：{config.get('concurrency.workers', 8)}")
+        await crawler.run(pending)
+    else:
+        # 3. 否则顺序爬取
+        logger.info("开始遍历省份列表...")
+        for province in pending:
+            await crawl_province(crawler, province)
+
+    db.close()
+    await progress.close()
+    log_delta(crawler.delta)
+    if response_cache.enabled:
+        logger.info(f"响应缓存：命中{response_cache.hits}次，未命中{response_cache.misses}次")
+    response_cache.close()
+    log_time_breakdown()
+    log_trace()
+    logger.info("所有省份爬取完成！")
+    if exporter:
+        await exporter.close()
+    if proxy_manager:
+        await proxy_manager.close()
     await session.close()
 
 
-asyncio.run(work())
+async def shard_work(index, options, task_queue, progress_queue, retry_done):
+    """
+    多进程模式下单个进程的工作：单独登录、单独的代理管理器和数据库写入线程，
+    从共享任务队列中逐个领取省份，完成后把进度发回主进程
+    """
+    tracer.use_shard(index)
+    session = await login(options['credentials'])
+    exporter = await start_metrics(index)
+    proxy_manager = await create_proxy_manager(options['network'])
+    crawler = Crawler(session, breakpoint=options['breakpoint'], proxy_manager=proxy_manager,
+                      checkpoint=create_checkpoint(options['breakpoint_mode']), delta=create_delta(options['delta']))
+    crawler.province_names = options['province_names']
+    progress = ProgressReporter(crawler, db.writer, config.get('logging.progress_interval', 30))
+    progress.start()
+
+    # 只由第一个进程补抓日志失败项，其他进程等它完成后再开始，避免同时改写日志文件
+    if index == 0:
+        await retry_failed_requests(crawler)
+        retry_done.set()
+    else:
+        await asyncio.to_thread(retry_done.wait)
+
+    while True:
+        try:
+            province = task_queue.get_nowait()
+        except queue.Empty:
+            break
+        progress_queue.put(('start', index, province['name'], db.writer.inserted))
+        await crawl_province(crawler, province)
+        await asyncio.to_thread(db.flush)
+        progress_queue.put(('done', index, province['name'], db.writer.inserted))
+
+    db.close()
+    await progress.close()
+    log_delta(crawler.delta)
+    response_cache.close()
+    log_time_breakdown()
+    log_trace()
+    if exporter:
+        await exporter.close()
+    if proxy_manager:
+        await proxy_manager.close()
+    await session.close()
+
+
+def shard_worker(index, options, task_queue, progress_queue, retry_done):
+    setup_logging()
+    try:
+        asyncio.run(shard_work(index, options, task_queue, progress_queue, retry_done))
+    finally:
+        retry_done.set()  # 第一个进程异常退出时也不能让其他进程一直等待
+        stop_logging()
+
+
+def coordinate(args, shards):
+    """
+    多进程模式：主进程只负责收集参数、分发省份和汇总进度，省份由 shards 个子进程动态领取
+    """
+    try:
+        provinces = select_provinces(get_option(args, 'provinces', 'YZW_PROVINCES'))
+        credentials = Login.ask_credentials(
+            get_option(args, 'login', 'YZW_LOGIN'),
+            get_option(args, 'username', 'YZW_USERNAME'),
+            get_option(args, 'password', 'YZW_PASSWORD'),
+            get_option(args, 'cookie', 'YZW_COOKIE'),
+        )
+        network = resolve_network(args)
+        mode = resolve_breakpoint_mode(args)
+        last_major = resolve_breakpoint(args, mode)
+    except KeyboardInterrupt:
+        logger.warning("程序被用户中断")
+        return
+    except ValueError as e:
+        logger.error(f"错误：{e}")
+        return
+    pending, last_major = pending_provinces(provinces, last_major)
+    if args.reset_checkpoint:
+        db.reset_crawl_state()
+        logger.info("已清空抓取状态")
+    if args.refresh_cache:
+        response_cache.clear()
+        response_cache.close()
+        logger.info("已清空响应缓存")
+    options = {
+        'credentials': credentials,
+        'network': network,
+        'breakpoint': last_major,
+        'breakpoint_mode': mode,
+        'delta': use_delta(args),
+        'province_names': {p['code']: p['name'] for p in provinces},
+    }
+
+    ctx = multiprocessing.get_context('spawn')
+    manager = ctx.Manager()
+    task_queue = manager.Queue()
+    progress_queue = manager.Queue()
+    retry_done = manager.Event()
+    for province in pending:
+        task_queue.put(province)
+
+    shards = max(1, min(shards, len(pending)))
+    logger.info(f"多进程模式：共{len(pending)}个省份，进程数量：{shards}")
+    started = time.monotonic()
+    processes = [
+        ctx.Process(target=shard_worker, args=(i, options, task_queue, progress_queue, retry_done), name=f'shard-{i}')
+        for i in range(shards)
+    ]
+    for process in processes:
+        process.start()
+
+    running = {}  # 进程编号 -> (正在爬取的省份, 开始时的新增行数)
+    done = []
+    inserted = [0] * shards
+    while any(p.is_alive() for p in processes) or not progress_queue.empty():
+        try:
+            event, index, province_name, rows = progress_queue.get(timeout=1)
+        except queue.Empty:
+            continue
+        inserted[index] = rows
+        if event == 'start':
+            running[index] = (province_name, rows)
+            logger.info(f"[进程{index}] 开始爬取{province_name}")
+        else:
+            _, rows_before = running.pop(index, (province_name, rows))
+            done.append(province_name)
+            elapsed = time.monotonic() - started
+            logger.info(f"[进程{index}] {province_name}完成，新增{rows - rows_before}条；"
+                        f"进度{len(done)}/{len(pending)}，累计新增{sum(inserted)}条，用时{elapsed:.0f}秒")
+
+    for process in processes:
+        process.join()
+        if process.exitcode != 0:
+            logger.error(f"{process.name}异常退出，退出码：{process.exitcode}")
+    unfinished = [name for name, _ in running.values()]
+    while not task_queue.empty():
+        unfinished.append(task_queue.get()['name'])
+    if unfinished:
+        logger.warning(f"以下省份未完成，请稍后用 --provinces 单独重新爬取：{', '.join(unfinished)}")
+    manager.shutdown()
+    logger.info(f"所有省份爬取完成！共完成{len(done)}个省份，新增{sum(inserted)}条")
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    setup_logging()
+    shards = args.shards or int(os.environ.get('YZW_SHARDS') or config.get('run.shards') or 1)
+    try:
+        if shards > 1:
+            coordinate(args, shards)
+        else:
+            asyncio.run(work(args))
+    finally:
+        stop_logging()
@@ -1,123 +1,314 @@
 import aiohttp
 import asyncio
 import random
-from typing import Optional, List, Dict
+import time
+from typing import Optional, List, Dict, Set
 import logging
 import datetime
 
+from config import config
+from crawler.metrics import metrics
+
+logger = logging.getLogger('yzw.proxy')
+
+
 class ProxyManager:
-    def __init__(self, proxy_pool_url: str = "http://127.0.0.1:5010"):
+    """
+    代理池：同时维护 pool_size 个可用代理，每个请求按评分加权随机选择其中一个。
+    每个代理记录延迟和成功率的指数滑动平均（EWMA），后台验证任务会并发检测代理、
+    剔除失效代理并从代理池API补充新代理，被剔除的代理在冷却时间过后可以重新使用
+    """
+
+    def __init__(self, proxy_pool_url: str = "http://127.0.0.1:5010", pool_size: Optional[int] = None):
         self.proxy_pool_url = proxy_pool_url
-        self.proxies: List[str] = []
-        self.current_proxy: Optional[str] = None
-        self.failed_proxies: set = set()
-        self.max_retries = 3
-        
+        self.pool_size = pool_size or config.get('proxy.pool_size', 5)
+        self.proxies: List[str] = []  # 当前轮换中的可用代理
+        self.current_proxy: Optional[str] = None  # 最近一次分配出去的代理
+        self.failed_proxies: Dict[str, float] = {}  # 被剔除的代理 -> 解禁时间
+        self.max_retries = 3  # 连续失败达到该次数的代理会被剔除
+        self.stats: Dict[str, Dict[str, float]] = {}  # 每个代理的健康统计
+        self.test_url = config.get('proxy.test_url', 'https://yz.chsi.com.cn/zsml/a/dw.do')
+        self.test_timeout = config.get('proxy.test_timeout', 10)
+        self.backup_proxies: List[str] = config.get('proxy.backup_proxies', []) or []
+        self.ban_cooldown = config.get('proxy.ban_cooldown', 600)  # 剔除后的冷却时间，单位：秒
+        self.validate_interval = config.get('proxy.validate_interval', 30)  # 后台验证间隔，单位：秒
+        self.ewma_alpha = 0.3  # EWMA中新样本的权重
+        self._validate_task: Optional[asyncio.Task] = None
+        self._tasks: Set[asyncio.Task] = set()  # 进行中的代理池删除请求，保留引用避免被回收
+        self._wakeup = asyncio.Event()  # 代理池不足时提前唤醒后台验证任务
+        self._session: Optional[aiohttp.ClientSession] = None
+        metrics.add_collector(self.collect_metrics)
+
+    def get_session(self) -> aiohttp.ClientSession:
+        """代理池API和代理检测共用的长连接session，避免每次切换代理都重新建立TCP/TLS连接"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=config.get('proxy.connection_limit', 50),
+                limit_per_host=config.get('proxy.limit_per_host', 10),
+                keepalive_timeout=config.get('proxy.keepalive_timeout', 30),
+                ttl_dns_cache=config.get('proxy.ttl_dns_cache', 300),
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
     async def get_proxy_from_pool(self) -> Optional[str]:
         """从代理池获取代理"""
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(f"{self.proxy_pool_url}/get/") as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        if data.get("proxy"):
-                            return data["proxy"]
+            async with self.get_session().get(f"{self.proxy_pool_url}/get/") as response:
+                if response.status == 200:
+                    data = await response.json()
+                    if data.get("proxy"):
+                        return data["proxy"]
         except Exception as e:
-            logging.warning(f"从代理池获取代理失败: {e}")
+            logger.warning(f"从代理池获取代理失败: {e}")
         return None
-    
+
     async def delete_proxy_from_pool(self, proxy: str):
         """从代理池删除失效代理"""
         try:
-            async with aiohttp.ClientSession() as session:
-                await session.get(f"{self.proxy_pool_url}/delete/?proxy={proxy}")
+            async with self.get_session().get(f"{self.proxy_pool_url}/delete/", params={'proxy': proxy}) as response:
+                await response.read()
         except Exception as e:
-            logging.warning(f"删除代理失败: {e}")
-    
+            logger.warning(f"删除代理失败: {e}")
+
     async def switch_proxy(self) -> Optional[str]:
-        """切换代理"""
-        if self.current_proxy:
-            self.failed_proxies.add(self.current_proxy)
-            # 从代理池删除失效代理
-            await self.delete_proxy_from_pool(self.current_proxy)
-        
-        # 尝试从代理池获取新代理
-        new_proxy = await self.get_proxy_from_pool()
-        if new_proxy and new_proxy not in self.failed_proxies:
-            self.current_proxy = new_proxy
-            logging.info(f"切换到新代理: {new_proxy}")
-            return new_proxy
-        
-        # 如果代理池没有可用代理，尝试使用备用代理
-        backup_proxies = [
-            "127.0.0.1:7890",  # 常见的代理端口
-            "127.0.0.1:1080",
-            "127.0.0.1:8080",
-        ]
-        
-        for proxy in backup_proxies:
-            if proxy not in self.failed_proxies:
-                self.current_proxy = proxy
-                logging.info(f"使用备用代理: {proxy}")
-                return proxy
-        
+        """切换代理：直接返回当前评分最高的代理，不等待代理池API"""
+        proxy = self.best_proxy()
+        if len(self.proxies) < self.pool_size:
+            self._wakeup.set()
+        if proxy:
+            self.current_proxy = proxy
+            logger.info(f"切换到新代理: {proxy}")
+            return proxy
+
         # 所有代理都失败了，返回None表示使用自身IP
-        logging.warning("所有代理都失败，将使用自身IP")
+        logger.warning("所有代理都失败，将使用自身IP")
         self.current_proxy = None
         return None
-    
+
+    def collect_metrics(self):
+        """各代理的成功/失败次数、成功率和延迟，输出指标时调用"""
+        samples = []
+        for proxy, stat in self.stats.items():
+            samples.append(('yzw_proxy_requests_total', {'proxy': proxy, 'result': 'success'}, stat['success'], 'counter'))
+            samples.append(('yzw_proxy_requests_total', {'proxy': proxy, 'result': 'failure'}, stat['failure'], 'counter'))
+            samples.append(('yzw_proxy_success_rate', {'proxy': proxy}, stat['success_rate']))
+            samples.append(('yzw_proxy_latency_seconds', {'proxy': proxy}, stat['latency']))
+        return samples
+
+    def is_banned(self, proxy: str) -> bool:
+        """代理是否处于冷却期，冷却时间已过的代理会自动解禁"""
+        until = self.failed_proxies.get(proxy)
+        if until is None:
+            return False
+        if time.monotonic() >= until:
+            del self.failed_proxies[proxy]
+            return False
+        return True
+
+    def ban_proxy(self, proxy: str):
+        self.failed_proxies[proxy] = time.monotonic() + self.ban_cooldown
+
+    async def fetch_candidates(self, count: int) -> List[str]:
+        """并发获取若干个候选代理（不在轮换中、不在冷却期），代理池没有时使用备用代理"""
+        results = await asyncio.gather(*(self.get_proxy_from_pool() for _ in range(count)))
+        candidates = []
+        for proxy in list(results) + self.backup_proxies:
+            if proxy and proxy not in candidates and proxy not in self.proxies and not self.is_banned(proxy):
+                candidates.append(proxy)
+        return candidates[:count]
+
+    async def refill(self):
+        """并发检测候选代理，把可用代理补充到 pool_size 个"""
+        missing = self.pool_size - len(self.proxies)
+        if missing <= 0:
+            return
+        candidates = await self.fetch_candidates(missing * 2)
+        latencies = await asyncio.gather(*(self.measure_proxy(proxy) for proxy in candidates))
+        for proxy, latency in sorted(zip(candidates, latencies), key=lambda x: (x[1] is None, x[1])):
+            if latency is None:
+                self.ban_proxy(proxy)
+            elif len(self.proxies) < self.pool_size:
+                self.add_proxy(proxy, latency)
+
+    async def validate(self):
+        """并发检测轮换中的代理，更新健康统计并剔除失效代理，然后补充代理池"""
+        proxies = list(self.proxies)
+        latencies = await asyncio.gather(*(self.measure_proxy(proxy) for proxy in proxies))
+        for proxy, latency in zip(proxies, latencies):
+            if latency is None:
+                self.report_failure(proxy)
+            else:
+                self._update_stats(proxy, True, latency)
+        await self.refill()
+
+    async def _validate_loop(self):
+        """后台任务：定期验证代理，代理不足时会被提前唤醒"""
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.validate_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.validate()
+            except Exception as e:
+                logger.warning(f"验证代理失败: {e}")
+
+    def add_proxy(self, proxy: str, latency: Optional[float] = None):
+        if proxy not in self.proxies:
+            self.proxies.append(proxy)
+            # 重新加入的代理保留累计次数，滑动平均从头计算
+            old = self.stats.get(proxy, {})
+            self.stats[proxy] = {
+                'success': old.get('success', 0), 'failure': old.get('failure', 0), 'consecutive_failure': 0,
+                'latency': latency if latency is not None else self.test_timeout, 'success_rate': 1.0,
+            }
+            logger.info(f"代理加入轮换: {proxy}")
+
+    def remove_proxy(self, proxy: str):
+        if proxy in self.proxies:
+            self.proxies.remove(proxy)
+        self.ban_proxy(proxy)
+        logger.warning(f"代理已剔除: {proxy}，{self.ban_cooldown}秒后可重新使用")
+        # 从代理池删除失效代理
+        task = asyncio.create_task(self.delete_proxy_from_pool(proxy))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        self._wakeup.set()
+
+    def score(self, proxy: str) -> float:
+        """代理评分：成功率越高、延迟越低，评分越高"""
+        stat = self.stats.get(proxy)
+        if not stat:
+            return 0.0
+        return stat['success_rate'] / max(stat['latency'], 0.05)
+
+    def best_proxy(self) -> Optional[str]:
+        if not self.proxies:
+            return None
+        return max(self.proxies, key=self.score)
+
+    def get_proxy_address(self) -> Optional[str]:
+        """
+        按评分加权随机选出一个代理（ip:port），没有可用代理时返回None。
+        请求仍分散到多个IP上，但成功率高、延迟低的代理分到更多请求。
+        最近一次请求失败的代理在还有其他代理时不参与选择，后台验证成功后恢复
+        """
+        if not self.proxies:
+            return None
+        candidates = [proxy for proxy in self.proxies
+                      if not self.stats.get(proxy, {}).get('consecutive_failure')] or self.proxies
+        # 评分为0的代理保留很小的权重
+        weights = [max(self.score(proxy), 1e-3) for proxy in candidates]
+        self.current_proxy = random.choices(candidates, weights=weights)[0]
+        return self.current_proxy
+
+    def get_proxy(self) -> Optional[str]:
+        """为一次请求选出代理，返回aiohttp的proxy参数格式，None表示使用自身IP"""
+        proxy = self.get_proxy_address()
+        return f"http://{proxy}" if proxy else None
+
+    def report_success(self, proxy_url: Optional[str], latency: Optional[float] = None):
+        proxy = self._address(proxy_url)
+        if proxy in self.stats:
+            self._update_stats(proxy, True, latency)
+
+    def report_failure(self, proxy_url: Optional[str]):
+        proxy = self._address(proxy_url)
+        if proxy not in self.stats:
+            return
+        self._update_stats(proxy, False)
+        if self.stats[proxy]['consecutive_failure'] >= self.max_retries and proxy in self.proxies:
+            self.remove_proxy(proxy)
+
+    def _update_stats(self, proxy: str, success: bool, latency: Optional[float] = None):
+        stat = self.stats[proxy]
+        alpha = self.ewma_alpha
+        stat['success_rate'] = alpha * (1.0 if success else 0.0) + (1 - alpha) * stat['success_rate']
+        if success:
+            stat['success'] += 1
+            stat['consecutive_failure'] = 0
+            if latency is not None:
+                stat['latency'] = alpha * latency + (1 - alpha) * stat['latency']
+        else:
+            stat['failure'] += 1
+            stat['consecutive_failure'] += 1
+
+    @staticmethod
+    def _address(proxy_url: Optional[str]) -> Optional[str]:
+        return proxy_url[len('http://'):] if proxy_url and proxy_url.startswith('http://') else proxy_url
+
     def record_direct_ip_failure(self, error_info: str):
         """记录自身IP失败"""
-        logging.error(f"自身IP也失败，程序将退出: {error_info}")
+        logger.error(f"自身IP也失败，程序将退出: {error_info}")
         # 可以在这里记录到文件或数据库
         with open('ip_failure.log', 'a', encoding='utf-8') as f:
             timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             f.write(f"[{timestamp}] 自身IP失败: {error_info}\n")
-    
+
     def should_use_proxy(self) -> bool:
         """判断是否应该使用代理"""
-        return self.current_proxy is not None and self.current_proxy not in self.failed_proxies
-    
+        return bool(self.proxies)
+
     def get_current_proxy(self) -> Optional[str]:
         """获取当前代理"""
         return self.current_proxy
-    
+
     def get_proxy_dict(self) -> Optional[Dict[str, str]]:
         """获取代理字典格式，用于aiohttp"""
         if not self.should_use_proxy():
             return None
-        
+
         return {
             "http": f"http://{self.current_proxy}",
             "https": f"http://{self.current_proxy}"
         }
-    
-    async def test_proxy(self, proxy: str, test_url: str = "https://www.baidu.com") -> bool:
-        """测试代理是否可用"""
+
+    async def measure_proxy(self, proxy: str, test_url: Optional[str] = None) -> Optional[float]:
+        """通过代理请求测试地址，返回耗时（秒），不可用时返回None"""
         try:
-            proxy_dict = {
-                "http": f"http://{proxy}",
-                "https": f"http://{proxy}"
-            }
-            
-            timeout = aiohttp.ClientTimeout(total=10)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.get(test_url, proxy=proxy_dict["http"]) as response:
-                    return response.status == 200
+            timeout = aiohttp.ClientTimeout(total=self.test_timeout)
+            started = time.monotonic()
+            async with self.get_session().get(test_url or self.test_url, proxy=f"http://{proxy}",
+                                              timeout=timeout) as response:
+                await response.read()
+                if response.status == 200:
+                    return time.monotonic() - started
         except Exception:
-            return False
-    
+            pass
+        return None
+
+    async def test_proxy(self, proxy: str, test_url: Optional[str] = None) -> bool:
+        """测试代理是否可用"""
+        return await self.measure_proxy(proxy, test_url) is not None
+
     async def initialize_proxy(self):
-        """初始化代理"""
-        logging.info("正在初始化代理...")
-        proxy = await self.switch_proxy()
-        if proxy:
-            # 测试代理可用性
-            if await self.test_proxy(proxy):
-                logging.info(f"代理初始化成功: {proxy}")
-                return True
-            else:
-                logging.warning(f"代理测试失败: {proxy}")
-                self.failed_proxies.add(proxy)
-                return await self.initialize_proxy()
-        return False 
\ No newline at end of file
+        """初始化代理池，并启动后台验证任务"""
+        logger.info("正在初始化代理...")
+        await self.refill()
+        if self._validate_task is None:
+            self._validate_task = asyncio.create_task(self._validate_loop())
+        if self.proxies:
+            logger.info(f"代理初始化成功，可用代理{len(self.proxies)}个: {self.proxies}")
+            return True
+        logger.warning("没有可用代理")
+        return False
+
+    async def close(self):
+        """停止后台验证任务，等待进行中的代理池删除请求（最多5秒，超时取消），然后关闭session"""
+        if self._validate_task:
+            self._validate_task.cancel()
+            try:
+                await self._validate_task
+            except asyncio.CancelledError:
+                pass
+            self._validate_task = None
+        if self._tasks:
+            _, pending = await asyncio.wait(set(self._tasks), timeout=5)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
@@ -0,0 +1,102 @@
+import argparse
+import json
+from collections import defaultdict
+
+PHASES = ['queued', 'dns', 'connect', 'send', 'ttfb', 'body', 'total']
+
+
+def load_records(paths):
+    records = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue  # 程序中断时可能留下写了一半的行
+    return records
+
+
+def group_key(record, by):
+    endpoint = record.get('endpoint') or record.get('url', '').rsplit('/', 1)[-1] or '-'
+    proxy = record.get('proxy') or '自身IP'
+    if by == 'endpoint':
+        return endpoint
+    if by == 'proxy':
+        return proxy
+    return f'{endpoint} @ {proxy}'
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def summarize(records, by='endpoint'):
+    """
+    按接口/代理分组，统计每个阶段的 p50/p95/p99 和平均耗时，以及各阶段占总耗时的比例
+    """
+    groups = defaultdict(list)
+    for record in records:
+        groups[group_key(record, by)].append(record)
+
+    summary = {}
+    for key, items in sorted(groups.items()):
+        phases = {}
+        for phase in PHASES:
+            # 复用连接的请求没有 dns/connect，按0计算，这样平均值反映的是每个请求实际花费的时间
+            values = [item.get(phase) or 0 for item in items if item.get('total') is not None]
+            phases[phase] = {
+                'p50': percentile(values, 50),
+                'p95': percentile(values, 95),
+                'p99': percentile(values, 99),
+                'mean': sum(values) / len(values) if values else None,
+            }
+        total_mean = phases['total']['mean'] or 0
+        summary[key] = {
+            'count': len(items),
+            'errors': sum(1 for item in items if item.get('error') or (item.get('status') or 200) >= 400),
+            'reused': sum(1 for item in items if item.get('reused')) / len(items),
+            'phases': phases,
+            'share': {phase: (phases[phase]['mean'] or 0) / total_mean if total_mean else 0
+                      for phase in PHASES[:-1]},
+        }
+    return summary
+
+
+def print_summary(summary):
+    def fmt(value):
+        return '-' if value is None else f'{value:.1f}'
+
+    for key, stats in summary.items():
+        print(f"\n== {key}：{stats['count']}个请求，失败{stats['errors']}个，复用连接{stats['reused']:.0%}")
+        print(f"{'阶段':<8}{'p50':>10}{'p95':>10}{'p99':>10}{'平均':>10}{'占比':>8}")
+        for phase in PHASES:
+            p = stats['phases'][phase]
+            share = f"{stats['share'][phase]:.0%}" if phase in stats['share'] else ''
+            print(f"{phase:<10}{fmt(p['p50']):>10}{fmt(p['p95']):>10}{fmt(p['p99']):>10}{fmt(p['mean']):>10}{share:>8}")
+        dominant = max(stats['share'], key=stats['share'].get)
+        print(f"耗时最多的阶段：{dominant}（ttfb 主要是服务器处理时间，connect 包括与代理的连接和TLS握手）")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='汇总请求跟踪文件（config.yaml 中 trace 部分生成的JSONL），单位：毫秒')
+    parser.add_argument('paths', nargs='+', help='跟踪文件，多进程模式下可以同时指定多个')
+    parser.add_argument('--by', choices=['endpoint', 'proxy', 'both'], default='endpoint',
+                        help='按接口、代理或两者分组，默认按接口')
+    parser.add_argument('--json', action='store_true', help='以JSON格式输出')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    summary = summarize(load_records(args.paths), args.by)
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+    else:
+        print_summary(summary)
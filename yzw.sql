@@ -17,32 +17,175 @@
 SET NAMES utf8mb4;
 SET FOREIGN_KEY_CHECKS = 0;
 
+-- ----------------------------
+-- Table structure for school
+-- ----------------------------
+DROP TABLE IF EXISTS `school`;
+CREATE TABLE `school`  (
+  `id` int NOT NULL AUTO_INCREMENT COMMENT '主键',
+  `name` varchar(100) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL COMMENT '学校名称',
+  `code` varchar(20) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL COMMENT '学校代码',
+  `province` varchar(100) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL COMMENT '所在省份',
+  PRIMARY KEY (`id`) USING BTREE,
+  UNIQUE INDEX `name`(`name` ASC) USING BTREE
+) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_0900_ai_ci ROW_FORMAT = Dynamic;
+
+-- ----------------------------
+-- Table structure for department
+-- ----------------------------
+DROP TABLE IF EXISTS `department`;
+CREATE TABLE `department`  (
+  `id` int NOT NULL AUTO_INCREMENT COMMENT '主键',
+  `school_id` int NOT NULL COMMENT '学校',
+  `name` varchar(100) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL COMMENT '院系所名称',
+  PRIMARY KEY (`id`) USING BTREE,
+  UNIQUE INDEX `school_department`(`school_id` ASC, `name` ASC) USING BTREE,
+  CONSTRAINT `department_school` FOREIGN KEY (`school_id`) REFERENCES `school` (`id`)
+) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_0900_ai_ci ROW_FORMAT = Dynamic;
+
+-- ----------------------------
+-- Table structure for subject
+-- ----------------------------
+DROP TABLE IF EXISTS `subject`;
+CREATE TABLE `subject`  (
+  `id` int NOT NULL AUTO_INCREMENT COMMENT '主键',
+  `name` varchar(100) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL COMMENT '考试科目名称',
+  PRIMARY KEY (`id`) USING BTREE,
+  UNIQUE INDEX `name`(`name` ASC) USING BTREE
+) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_0900_ai_ci ROW_FORMAT = Dynamic;
+
 -- ----------------------------
 -- Table structure for major
 -- ----------------------------
 DROP TABLE IF EXISTS `major`;
 CREATE TABLE `major`  (
-  `school_name` varchar(100) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL COMMENT '学校名称',
+  `school_id` int NULL DEFAULT NULL COMMENT '学校',
   `major_name` varchar(100) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL COMMENT '专业名称',
-  `province` varchar(100) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL COMMENT '所在省份',
   `major_code` varchar(20) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL COMMENT '专业代码',
   `degree_type` varchar(100) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL COMMENT '学位类型',
   `exam_type` varchar(20) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL COMMENT '考试方式',
-  `department` varchar(100) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL COMMENT '院系所',
+  `department_id` int NULL DEFAULT NULL COMMENT '院系所',
   `study_mode` varchar(100) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL COMMENT '学习方式',
   `research_direction` varchar(100) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL COMMENT '研究方向',
   `veteran_program` varchar(100) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL COMMENT '退役计划',
   `shaogu_program` varchar(100) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL COMMENT '少骨计划',
   `advisor` varchar(500) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL COMMENT '指导教师',
   `planned_enrollment` varchar(100) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL COMMENT '拟招生人数',
-  `exam_subject1` varchar(50) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL COMMENT '考试科目1',
-  `exam_subject2` varchar(50) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL COMMENT '考试科目2',
-  `exam_subject3` varchar(50) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL COMMENT '考试科目3',
-  `exam_subject4` varchar(50) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL COMMENT '考试科目4',
+  `exam_subject1_id` int NULL DEFAULT NULL COMMENT '考试科目1',
+  `exam_subject2_id` int NULL DEFAULT NULL COMMENT '考试科目2',
+  `exam_subject3_id` int NULL DEFAULT NULL COMMENT '考试科目3',
+  `exam_subject4_id` int NULL DEFAULT NULL COMMENT '考试科目4',
   `id` int NOT NULL AUTO_INCREMENT COMMENT '主键',
+  `content_hash` binary(16) NOT NULL COMMENT '身份字段的MD5，唯一索引',
   PRIMARY KEY (`id`) USING BTREE,
-  UNIQUE INDEX `unique`(`department` ASC, `research_direction` ASC, `major_code` ASC, `study_mode` ASC, `exam_type` ASC, `school_name` ASC, `exam_subject1` ASC, `exam_subject2` ASC, `exam_subject3` ASC, `exam_subject4` ASC) USING BTREE COMMENT '确保唯一',
-  INDEX `major`(`major_name` ASC) USING BTREE COMMENT '专业名称索引'
+  UNIQUE INDEX `content_hash`(`content_hash` ASC) USING BTREE COMMENT '确保唯一',
+  INDEX `major`(`major_name` ASC) USING BTREE COMMENT '专业名称索引',
+  INDEX `school_id`(`school_id` ASC) USING BTREE,
+  CONSTRAINT `major_school` FOREIGN KEY (`school_id`) REFERENCES `school` (`id`),
+  CONSTRAINT `major_department` FOREIGN KEY (`department_id`) REFERENCES `department` (`id`),
+  CONSTRAINT `major_subject1` FOREIGN KEY (`exam_subject1_id`) REFERENCES `subject` (`id`),
+  CONSTRAINT `major_subject2` FOREIGN KEY (`exam_subject2_id`) REFERENCES `subject` (`id`),
+  CONSTRAINT `major_subject3` FOREIGN KEY (`exam_subject3_id`) REFERENCES `subject` (`id`),
+  CONSTRAINT `major_subject4` FOREIGN KEY (`exam_subject4_id`) REFERENCES `subject` (`id`)
 ) ENGINE = InnoDB AUTO_INCREMENT = 185134 CHARACTER SET = utf8mb4 COLLATE = utf8mb4_0900_ai_ci ROW_FORMAT = Dynamic;
 
+-- ----------------------------
+-- 旧数据库迁移：把10个字段的联合唯一索引换成 content_hash（计算方式与 data/db.py 的 content_hash 一致）
+-- 原索引不区分大小写，迁移前如有仅大小写不同的重复数据会同时保留
+-- ----------------------------
+-- ALTER TABLE `major` ADD COLUMN `content_hash` binary(16) NULL COMMENT '身份字段的MD5，唯一索引';
+-- UPDATE `major` SET `content_hash` = UNHEX(MD5(CONCAT_WS(CHAR(31 USING utf8mb4),
+--   IFNULL(`department`, CHAR(0 USING utf8mb4)), IFNULL(`research_direction`, CHAR(0 USING utf8mb4)),
+--   IFNULL(`major_code`, CHAR(0 USING utf8mb4)), IFNULL(`study_mode`, CHAR(0 USING utf8mb4)),
+--   IFNULL(`exam_type`, CHAR(0 USING utf8mb4)), IFNULL(`school_name`, CHAR(0 USING utf8mb4)),
+--   IFNULL(`exam_subject1`, CHAR(0 USING utf8mb4)), IFNULL(`exam_subject2`, CHAR(0 USING utf8mb4)),
+--   IFNULL(`exam_subject3`, CHAR(0 USING utf8mb4)), IFNULL(`exam_subject4`, CHAR(0 USING utf8mb4)))));
+-- ALTER TABLE `major` MODIFY COLUMN `content_hash` binary(16) NOT NULL COMMENT '身份字段的MD5，唯一索引',
+--   DROP INDEX `unique`, ADD UNIQUE INDEX `content_hash`(`content_hash` ASC) USING BTREE COMMENT '确保唯一';
+--
+-- 旧数据库迁移：学校、院系所、考试科目拆分到维度表（先执行上面的 content_hash 迁移，并创建 school/department/subject 表）
+-- INSERT IGNORE INTO `school` (`name`, `province`) SELECT `school_name`, MAX(`province`) FROM `major` WHERE `school_name` IS NOT NULL GROUP BY `school_name`;
+-- INSERT IGNORE INTO `department` (`school_id`, `name`) SELECT DISTINCT s.`id`, m.`department` FROM `major` m JOIN `school` s ON s.`name` = m.`school_name` WHERE m.`department` IS NOT NULL;
+-- INSERT IGNORE INTO `subject` (`name`) SELECT `exam_subject1` FROM `major` WHERE `exam_subject1` IS NOT NULL UNION SELECT `exam_subject2` FROM `major` WHERE `exam_subject2` IS NOT NULL
+--   UNION SELECT `exam_subject3` FROM `major` WHERE `exam_subject3` IS NOT NULL UNION SELECT `exam_subject4` FROM `major` WHERE `exam_subject4` IS NOT NULL;
+-- ALTER TABLE `major` ADD COLUMN `school_id` int NULL COMMENT '学校', ADD COLUMN `department_id` int NULL COMMENT '院系所',
+--   ADD COLUMN `exam_subject1_id` int NULL COMMENT '考试科目1', ADD COLUMN `exam_subject2_id` int NULL COMMENT '考试科目2',
+--   ADD COLUMN `exam_subject3_id` int NULL COMMENT '考试科目3', ADD COLUMN `exam_subject4_id` int NULL COMMENT '考试科目4';
+-- UPDATE `major` m JOIN `school` s ON s.`name` = m.`school_name` SET m.`school_id` = s.`id`;
+-- UPDATE `major` m JOIN `department` d ON d.`school_id` = m.`school_id` AND d.`name` = m.`department` SET m.`department_id` = d.`id`;
+-- UPDATE `major` m JOIN `subject` s ON s.`name` = m.`exam_subject1` SET m.`exam_subject1_id` = s.`id`;
+-- UPDATE `major` m JOIN `subject` s ON s.`name` = m.`exam_subject2` SET m.`exam_subject2_id` = s.`id`;
+-- UPDATE `major` m JOIN `subject` s ON s.`name` = m.`exam_subject3` SET m.`exam_subject3_id` = s.`id`;
+-- UPDATE `major` m JOIN `subject` s ON s.`name` = m.`exam_subject4` SET m.`exam_subject4_id` = s.`id`;
+-- ALTER TABLE `major` DROP COLUMN `school_name`, DROP COLUMN `province`, DROP COLUMN `department`,
+--   DROP COLUMN `exam_subject1`, DROP COLUMN `exam_subject2`, DROP COLUMN `exam_subject3`, DROP COLUMN `exam_subject4`,
+--   ADD INDEX `school_id`(`school_id` ASC) USING BTREE;
+--
+-- 已经拆分过维度表的数据库：空的考试科目改为关联名称为空字符串的科目，导出时为空字符串而不是NULL
+-- INSERT IGNORE INTO `subject` (`name`) VALUES ('');
+-- UPDATE `major` SET `exam_subject1_id` = (SELECT `id` FROM `subject` WHERE `name` = '') WHERE `exam_subject1_id` IS NULL;
+-- UPDATE `major` SET `exam_subject2_id` = (SELECT `id` FROM `subject` WHERE `name` = '') WHERE `exam_subject2_id` IS NULL;
+-- UPDATE `major` SET `exam_subject3_id` = (SELECT `id` FROM `subject` WHERE `name` = '') WHERE `exam_subject3_id` IS NULL;
+-- UPDATE `major` SET `exam_subject4_id` = (SELECT `id` FROM `subject` WHERE `name` = '') WHERE `exam_subject4_id` IS NULL;
+
+-- ----------------------------
+-- Table structure for crawl_state
+-- ----------------------------
+DROP TABLE IF EXISTS `crawl_state`;
+CREATE TABLE `crawl_state`  (
+  `id` int NOT NULL AUTO_INCREMENT COMMENT '主键',
+  `unit_type` varchar(20) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL COMMENT '单元类型：province/school/major',
+  `unit_key` varchar(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL COMMENT '单元标识',
+  `status` varchar(20) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL COMMENT '状态：done/failed',
+  `updated_at` datetime NOT NULL COMMENT '更新时间',
+  PRIMARY KEY (`id`) USING BTREE,
+  UNIQUE INDEX `unit`(`unit_type` ASC, `unit_key` ASC) USING BTREE COMMENT '每个单元一条记录'
+) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_0900_ai_ci ROW_FORMAT = Dynamic;
+
+-- ----------------------------
+-- Table structure for school_fingerprint
+-- ----------------------------
+DROP TABLE IF EXISTS `school_fingerprint`;
+CREATE TABLE `school_fingerprint`  (
+  `id` int NOT NULL AUTO_INCREMENT COMMENT '主键',
+  `school_code` varchar(20) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL COMMENT '学校代码',
+  `school_name` varchar(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL COMMENT '学校名称',
+  `total_count` int NULL DEFAULT NULL COMMENT '专业列表总数',
+  `digest` varchar(40) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL COMMENT '专业列表指纹',
+  `majors` mediumtext CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL COMMENT '各专业的哈希（JSON）',
+  `updated_at` datetime NOT NULL COMMENT '更新时间',
+  PRIMARY KEY (`id`) USING BTREE,
+  UNIQUE INDEX `school_code`(`school_code` ASC) USING BTREE
+) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_0900_ai_ci ROW_FORMAT = Dynamic;
+
+-- ----------------------------
+-- Table structure for major_list_change
+-- ----------------------------
+DROP TABLE IF EXISTS `major_list_change`;
+CREATE TABLE `major_list_change`  (
+  `id` int NOT NULL AUTO_INCREMENT COMMENT '主键',
+  `school_code` varchar(20) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL COMMENT '学校代码',
+  `school_name` varchar(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL COMMENT '学校名称',
+  `major_key` varchar(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL COMMENT '专业代码:专业名称',
+  `change_type` varchar(10) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL COMMENT '变化类型：insert/update/delete',
+  `crawled_at` datetime NOT NULL COMMENT '发现变化的爬取时间',
+  PRIMARY KEY (`id`) USING BTREE,
+  INDEX `school_code`(`school_code` ASC) USING BTREE
+) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_0900_ai_ci ROW_FORMAT = Dynamic;
+
+-- ----------------------------
+-- Table structure for major_change
+-- ----------------------------
+DROP TABLE IF EXISTS `major_change`;
+CREATE TABLE `major_change`  (
+  `id` int NOT NULL AUTO_INCREMENT COMMENT '主键',
+  `major_id` int NOT NULL COMMENT 'major表主键',
+  `column_name` varchar(50) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL COMMENT '变化的字段',
+  `old_value` varchar(500) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL COMMENT '旧值',
+  `new_value` varchar(500) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL COMMENT '新值',
+  `crawled_at` datetime NOT NULL COMMENT '爬取时间',
+  PRIMARY KEY (`id`) USING BTREE,
+  INDEX `major_id`(`major_id` ASC) USING BTREE
+) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_0900_ai_ci ROW_FORMAT = Dynamic;
+
 SET FOREIGN_KEY_CHECKS = 1;